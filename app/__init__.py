@@ -10,19 +10,38 @@ from flask_bootstrap import Bootstrap
 from flask_moment import Moment
 from flask_babel import Babel, lazy_gettext as _l
 from config import Config
-from dash import Dash
+from app.last_seen import LastSeen
+from app.translate import TranslationCache
+from app.language import LanguageDetector
+from app.data_version import DataVersion
+from app.dispatch import LazyDispatcher
+from app.metrics import Metrics
+from app.identity import IdentityCache
+from app.avatar import AvatarStore
+from app.fragments import FragmentCache
 from flask.helpers import get_root_path
-import dash_bootstrap_components as dbc
 
 db = SQLAlchemy()
 migrate = Migrate()
 login = LoginManager()
 login.login_view = 'auth.login'
 login.login_message = _l("Please log in to access this page.")
+# login of the flat report server, redirects to the login of the main app
+report_login = LoginManager()
+report_login.login_view = '/auth/login'
+report_login.login_message = login.login_message
 mail = Mail()
 bootstrap = Bootstrap()
 moment = Moment()
 babel = Babel()
+last_seen = LastSeen()
+translation_cache = TranslationCache()
+language_detector = LanguageDetector()
+data_version = DataVersion()
+metrics = Metrics()
+identity_cache = IdentityCache()
+avatar_store = AvatarStore()
+fragment_cache = FragmentCache()
 
 
 def create_app(config_class=Config):
@@ -36,6 +55,17 @@ def create_app(config_class=Config):
     bootstrap.init_app(app)
     moment.init_app(app)
     babel.init_app(app)
+    last_seen.init_app(app)
+    translation_cache.init_app(app)
+    language_detector.init_app(app)
+    data_version.init_app(app)
+    metrics.init_app(app)
+    identity_cache.init_app(app)
+    avatar_store.init_app(app)
+    fragment_cache.init_app(app)
+
+    from app.email import email_dispatcher
+    email_dispatcher.init_app(app)
 
     from app.errors import bp as errors_bp
     app.register_blueprint(errors_bp)
@@ -46,7 +76,15 @@ def create_app(config_class=Config):
     from app.main import bp as main_bp
     app.register_blueprint(main_bp)
 
-    register_dashapps(app)
+    from app.api import bp as api_bp
+    app.register_blueprint(api_bp, url_prefix='/api/v1')
+
+    if app.config['REPORT_DISPATCH'] == 'lazy':
+        app.wsgi_app = LazyDispatcher(
+            app.wsgi_app,
+            '/flat_report',
+            lambda: create_report_server(config_class).wsgi_app
+        )
 
     if not app.debug and not app.testing:
         if app.config['MAIL_SERVER']:
@@ -91,7 +129,32 @@ def create_app(config_class=Config):
     return app
 
 
+def create_report_server(config_class=Config):
+    """Create the server of the flat report. It is mounted below /flat_report
+    of the main app and built on the first request there, or served by its
+    own workers, e.g. ``SCRIPT_NAME=/flat_report gunicorn
+    'app:create_report_server()'``, with REPORT_DISPATCH set to 'external'.
+    """
+    server = Flask(__name__)
+    server.config.from_object(config_class)
+
+    db.init_app(server)
+    report_login.init_app(server)
+    babel.init_app(server)
+    data_version.init_app(server)
+    metrics.init_app(server)
+    identity_cache.init_app(server)
+
+    from app.models import load_user
+    report_login.user_loader(load_user)
+
+    register_dashapps(server)
+    return server
+
+
 def register_dashapps(server):
+    from dash import Dash
+    import dash_bootstrap_components as dbc
     from app.flat_report.layouts import layout
     from app.flat_report.callbacks import register_callbacks
 
@@ -101,7 +164,8 @@ def register_dashapps(server):
     flat_report = Dash(__name__,
                        server=server,
                        external_stylesheets=[dbc.themes.BOOTSTRAP],
-                       url_base_pathname='/flat_report/',
+                       routes_pathname_prefix='/',
+                       requests_pathname_prefix='/flat_report/',
                        assets_folder=get_root_path(__name__) + '/flat_report/assets/',
                        meta_tags=[meta_viewport])
 
@@ -113,7 +177,7 @@ def register_dashapps(server):
 
 def _protect_dashviews(dashapp):
     for view_func in dashapp.server.view_functions:
-        if view_func.startswith(dashapp.url_base_pathname):
+        if view_func.startswith(dashapp.config.routes_pathname_prefix):
             dashapp.server.view_functions[view_func] = login_required(dashapp.server.view_functions[view_func])
 
 
@@ -0,0 +1,234 @@
+"""Read-only JSON API over purchases, shops and users, mounted below
+/api/v1. Lists are paged with opaque cursors and every endpoint accepts a
+fields parameter to select the returned fields. Responses carry an ETag of
+the data version of :mod:`app.data_version` and the request, so a client
+sending it back as If-None-Match gets 304 Not Modified without a query as
+long as no purchase data changed.
+
+.. module:: api.routes
+   :platform: Unix, Windows
+   :synopsis: Versioned JSON API.
+"""
+
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from collections import OrderedDict
+from hashlib import sha1
+from flask import jsonify, request, url_for, current_app, g
+from flask_login import current_user
+from app import data_version
+from app.api import bp
+from app.models import User, Shop, Purchase
+from app.pagination import paginate_cursor
+
+
+def _isoformat(value):
+    return value.isoformat() + 'Z' if value is not None else None
+
+
+_purchase_fields = OrderedDict([
+    ('id', lambda p: p.id),
+    ('value', lambda p: p.value),
+    ('subject', lambda p: p.subject),
+    ('purchase_date', lambda p: _isoformat(p.purchase_date)),
+    ('timestamp', lambda p: _isoformat(p.timestamp)),
+    ('language', lambda p: p.language),
+    ('user', lambda p: p.author.username),
+    ('purchaser', lambda p: p.buyer.username if p.buyer else None),
+    ('shop', lambda p: p.seller.shopname)
+])
+_shop_fields = OrderedDict([
+    ('id', lambda s: s.id),
+    ('shopname', lambda s: s.shopname)
+])
+_user_fields = OrderedDict([
+    ('id', lambda u: u.id),
+    ('username', lambda u: u.username),
+    ('email', lambda u: u.email),
+    ('remindings', lambda u: u.remindings)
+])
+
+
+def error_response(status: int, message: str):
+    response = jsonify(error=status, message=message)
+    response.status_code = status
+    return response
+
+
+@bp.before_request
+def before_request():
+    if not current_user.is_authenticated:
+        return error_response(401, "login required")
+    g.api_etag = sha1('{0}|{1}'.format(
+        data_version.current(),
+        request.full_path
+    ).encode('utf-8')).hexdigest()
+    if request.if_none_match.contains(g.api_etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(g.api_etag)
+        return response
+
+
+@bp.after_request
+def after_request(response):
+    if response.status_code == 200 and 'api_etag' in g:
+        response.set_etag(g.api_etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return response
+
+
+def _select(fields: OrderedDict):
+    """Serializers of the fields parameter, all fields if not given.
+
+    :returns: Selected serializers or None for unknown fields.
+    :rtype: OrderedDict
+    """
+    names = request.args.get('fields')
+    if not names:
+        return fields
+    names = [name.strip() for name in names.split(',') if name.strip()]
+    if not names or any(name not in fields for name in names):
+        return None
+    return OrderedDict((name, fields[name]) for name in names)
+
+
+def _serialize(obj, fields: OrderedDict):
+    return OrderedDict(
+        (name, serializer(obj)) for name, serializer in fields.items()
+    )
+
+
+def _per_page():
+    return min(
+        request.args.get('per_page', current_app.config['ELEMENTS_PER_PAGE'],
+                         type=int),
+        current_app.config['API_MAX_PER_PAGE']
+    )
+
+
+def _page_url(**cursor):
+    args = request.args.to_dict()
+    args.pop('after', None)
+    args.pop('before', None)
+    args.update(cursor)
+    args.update(request.view_args)
+    return url_for(request.endpoint, _external=True, **args)
+
+
+def _purchase_list(query):
+    fields = _select(_purchase_fields)
+    if fields is None:
+        return error_response(400, "unknown field, choose from {0}".format(
+            ', '.join(_purchase_fields)
+        ))
+    page = paginate_cursor(
+        Purchase.with_details(query),
+        max(_per_page(), 1),
+        after=request.args.get('after'),
+        before=request.args.get('before')
+    )
+    return jsonify(
+        items=[_serialize(purchase, fields) for purchase in page.items],
+        next=_page_url(after=page.next_cursor) if page.has_next else None,
+        prev=_page_url(before=page.prev_cursor) if page.has_prev else None
+    )
+
+
+def _encode_id(id: int):
+    return urlsafe_b64encode(str(id).encode('ascii')).decode('ascii')
+
+
+def _decode_id(token: str):
+    try:
+        return int(urlsafe_b64decode(token.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError):
+        return None
+
+
+def _id_list(model, all_fields: OrderedDict):
+    """Page through model ordered by id with an opaque after cursor."""
+    fields = _select(all_fields)
+    if fields is None:
+        return error_response(400, "unknown field, choose from {0}".format(
+            ', '.join(all_fields)
+        ))
+    per_page = max(_per_page(), 1)
+    query = model.query.order_by(model.id)
+    after = _decode_id(request.args.get('after') or '')
+    if after is not None:
+        query = query.filter(model.id > after)
+    rows = query.limit(per_page + 1).all()
+    items = rows[:per_page]
+    return jsonify(
+        items=[_serialize(obj, fields) for obj in items],
+        next=_page_url(after=_encode_id(items[-1].id))
+        if len(rows) > per_page else None
+    )
+
+
+def _item(obj, all_fields: OrderedDict):
+    if obj is None:
+        return error_response(404, "not found")
+    fields = _select(all_fields)
+    if fields is None:
+        return error_response(400, "unknown field, choose from {0}".format(
+            ', '.join(all_fields)
+        ))
+    return jsonify(_serialize(obj, fields))
+
+
+@bp.route('/purchases')
+def purchases():
+    return _purchase_list(Purchase.query)
+
+
+@bp.route('/purchases/<int:id>')
+def purchase(id):
+    return _item(
+        Purchase.with_details(Purchase.query).filter_by(id=id).first(),
+        _purchase_fields
+    )
+
+
+@bp.route('/shops')
+def shops():
+    return _id_list(Shop, _shop_fields)
+
+
+@bp.route('/shops/<int:id>')
+def shop(id):
+    return _item(Shop.query.get(id), _shop_fields)
+
+
+@bp.route('/shops/<int:id>/purchases')
+def shop_purchases(id):
+    shop = Shop.query.get(id)
+    if shop is None:
+        return error_response(404, "not found")
+    return _purchase_list(shop.sales)
+
+
+@bp.route('/users')
+def users():
+    return _id_list(User, _user_fields)
+
+
+@bp.route('/users/<username>')
+def user(username):
+    return _item(User.query.filter_by(username=username).first(), _user_fields)
+
+
+@bp.route('/users/<username>/purchases')
+def user_purchases(username):
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        return error_response(404, "not found")
+    return _purchase_list(user.posts)
+
+
+@bp.route('/users/<username>/bought')
+def user_bought(username):
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        return error_response(404, "not found")
+    return _purchase_list(user.bought_purchases())
@@ -2,7 +2,7 @@ from flask import render_template, redirect, url_for, flash, request
 from werkzeug.urls import url_parse
 from flask_login import login_user, logout_user, current_user
 from flask_babel import lazy_gettext as _l
-from app import db
+from app import db, identity_cache, data_version
 from app.auth import bp
 from app.auth.forms import LoginForm, RegistrationForm, \
     ResetPasswordRequestForm, ResetPasswordForm
@@ -50,6 +50,7 @@ def register():
         user = User(username=form.username.data, email=form.email.data)
         user.set_password(form.password.data)
         db.session.add(user)
+        data_version.mark_changed(rewrite=False)
         db.session.commit()
         flash(_l("Congratulations, you are now a registered user!"))
         return redirect(url_for('auth.login'))
@@ -91,6 +92,7 @@ def reset_password(token):
     elif form.validate_on_submit():
         user.set_password(form.password.data)
         db.session.commit()
+        identity_cache.invalidate(user.id)
         flash(_l("Your password has been reset."))
         return redirect(url_for('auth.login'))
     else:
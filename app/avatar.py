@@ -0,0 +1,178 @@
+"""Locally rendered identicon avatars. The md5 digest of the email, as used
+for Gravatar, selects the color and a horizontally mirrored 5x5 pattern, so
+every user keeps the same avatar. Avatars are rendered as SVG and converted
+to PNG with cairosvg, then cached on disk per digest and size. Without a
+usable cairosvg (e.g. missing cairo library) the SVG is served instead.
+
+.. module:: avatar
+   :platform: Unix, Windows
+   :synopsis: Identicon avatars with on-disk cache.
+
+:Classes:
+
+    :class:`AvatarStore`
+
+:Functions:
+
+    :func:`identicon_svg`
+"""
+
+import colorsys
+import os
+import os.path as op
+import tempfile
+from threading import Lock
+
+
+def identicon_svg(digest: str, size: int):
+    """Render the identicon of a md5 hex digest as SVG document.
+
+    :param digest: md5 hex digest, 32 characters.
+    :type digest: str
+    :param size: Width and height in pixels.
+    :type size: int
+    :rtype: str
+    """
+    hue = int(digest[-7:], 16) / float(0xfffffff)
+    lightness = 0.45 + int(digest[-9:-7], 16) / 255. * 0.2
+    red, green, blue = colorsys.hls_to_rgb(hue, lightness, 0.6)
+    color = '#{0:02x}{1:02x}{2:02x}'.format(
+        int(red * 255), int(green * 255), int(blue * 255)
+    )
+    cells = []
+    for index in range(15):
+        if int(digest[index], 16) % 2:
+            continue
+        row, column = index % 5, index // 5
+        for x in {column, 4 - column}:
+            cells.append(
+                '<rect x="{0}" y="{1}" width="1" height="1"/>'.format(x, row)
+            )
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{0}" '
+        'viewBox="-0.5 -0.5 6 6" shape-rendering="crispEdges">'
+        '<rect x="-0.5" y="-0.5" width="6" height="6" fill="#f0f0f0"/>'
+        '<g fill="{1}">{2}</g></svg>'
+    ).format(size, color, ''.join(cells))
+
+
+def _svg2png():
+    try:
+        from cairosvg import svg2png
+    except (ImportError, OSError):
+        return None
+    return svg2png
+
+
+class AvatarStore(object):
+    """Flask extension rendering avatars into a disk cache. Only the sizes
+    used by the templates are rendered and the number of cached images is
+    bounded, the oldest images are removed first.
+
+    :Config:
+
+        :param AVATAR_CACHE_PATH: Directory of the rendered avatars.
+        :type AVATAR_CACHE_PATH: str
+        :param AVATAR_SIZES: Avatar sizes in pixels served.
+        :type AVATAR_SIZES: list
+        :param AVATAR_CACHE_LIMIT: Maximum number of cached images.
+        :type AVATAR_CACHE_LIMIT: int
+    """
+
+    def __init__(self, app=None):
+        self.path = None
+        self.sizes = {70, 128, 256}
+        self.limit = 10000
+        self._count = None
+        self._svg2png = None
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.path = app.config.get(
+            'AVATAR_CACHE_PATH',
+            op.join(app.instance_path, 'avatars')
+        )
+        self.sizes = set(app.config.get('AVATAR_SIZES', self.sizes))
+        self.limit = app.config.get('AVATAR_CACHE_LIMIT', self.limit)
+        self._count = None
+        self._svg2png = _svg2png()
+
+    @property
+    def mimetype(self):
+        return 'image/png' if self._svg2png is not None else 'image/svg+xml'
+
+    def _path(self, digest: str, size: int):
+        extension = 'png' if self._svg2png is not None else 'svg'
+        return op.join(
+            self.path,
+            digest[:2],
+            '{0}-{1}.{2}'.format(digest, size, extension)
+        )
+
+    def cached(self, digest: str, size: int):
+        """Cached avatar of digest and size.
+
+        :returns: Image bytes or None if not rendered yet.
+        :rtype: bytes
+        """
+        try:
+            with open(self._path(digest, size), 'rb') as f:
+                return f.read()
+        except (IOError, OSError):
+            return None
+
+    def render(self, digest: str, size: int):
+        """Render the avatar of digest and size into the cache.
+
+        :returns: Image bytes.
+        :rtype: bytes
+        """
+        svg = identicon_svg(digest, size).encode('utf-8')
+        image = self._svg2png(bytestring=svg) \
+            if self._svg2png is not None else svg
+        path = self._path(digest, size)
+        directory = op.dirname(path)
+        if not op.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(image)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if op.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._added()
+        return image
+
+    def _files(self):
+        for directory, _, names in os.walk(self.path):
+            for name in names:
+                yield op.join(directory, name)
+
+    def _added(self):
+        with self._lock:
+            if self._count is None:
+                self._count = sum(1 for _ in self._files())
+            else:
+                self._count += 1
+            if self._count <= self.limit:
+                return
+            files = []
+            for path in self._files():
+                try:
+                    files.append((op.getmtime(path), path))
+                except OSError:
+                    pass
+            files.sort()
+            # remove the oldest quarter, so pruning is rare
+            keep = self.limit * 3 // 4
+            for mtime, path in files[:max(len(files) - keep, 0)]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._count = min(len(files), keep)
@@ -1,7 +1,15 @@
 import os
 import os.path as op
 import glob as gl
+import json
+from time import perf_counter
 import click
+from app import db
+from app.models import Purchase, MonthlySummary
+from app.language import detect_pending_languages
+from app.settlement import settle
+from app.export import export_purchases, formats
+from app.snapshot import write_snapshot
 
 
 def register(app):
@@ -79,3 +87,183 @@ def register(app):
                 recursive=True
             )[::-1] if op.isdir(d)
         ]
+
+    @app.cli.group()
+    def purchases():
+        """Purchase data import and export commands."""
+        pass
+
+    @purchases.command('import')
+    @click.argument('path')
+    @click.option('--chunksize', default=10000, show_default=True,
+                  help="Number of rows read and committed at once.")
+    @click.option('--restart', is_flag=True,
+                  help="Ignore an existing checkpoint and start over.")
+    def import_csv(path: str, chunksize: int, restart: bool):
+        """Import purchases from a ';' separated .csv file in chunks.
+        Every chunk is committed on its own and followed by a checkpoint in
+        <path>.checkpoint, so an interrupted import resumes after the last
+        committed chunk. Rows with unknown user or purchaser are written to
+        <path>.rejected.csv instead of aborting the import. The checkpoint
+        holds the size of the rejected file, rows written after it are
+        dropped on resume and rejected again with their chunk.
+        :param path: Path to .csv file with header
+                     user;purchaser;purchase_date;shop;subject;value.
+        :type path: str.
+        :raises: FileNotFoundError.
+        """
+        checkpoint_path = path + '.checkpoint'
+        rejected_path = path + '.rejected.csv'
+        checkpoint = dict(rows=0, inserted=0, rejected=0, rejected_size=0)
+        if restart or not op.isfile(checkpoint_path):
+            if op.isfile(rejected_path):
+                os.remove(rejected_path)
+        else:
+            with open(checkpoint_path) as f:
+                checkpoint = json.load(f)
+            if 'rejected_size' in checkpoint and op.isfile(rejected_path):
+                with open(rejected_path, 'r+b') as f:
+                    f.truncate(checkpoint['rejected_size'])
+            click.echo("Resume after {0} rows".format(checkpoint['rows']))
+
+        start = perf_counter()
+        chunks = Purchase._load_from_csv(
+            path,
+            chunksize=chunksize,
+            skip=checkpoint['rows']
+        )
+        for chunk in chunks:
+            known, rejected = Purchase._split_unknown_users(chunk)
+            inserted = Purchase._bulk_add_purchases(known)
+            db.session.commit()
+            if not rejected.empty:
+                rejected.to_csv(
+                    rejected_path,
+                    sep=';',
+                    index=False,
+                    mode='a',
+                    header=not (op.isfile(rejected_path) and
+                                op.getsize(rejected_path))
+                )
+            checkpoint['rows'] += len(chunk)
+            checkpoint['inserted'] += inserted
+            checkpoint['rejected'] += len(rejected)
+            checkpoint['rejected_size'] = op.getsize(rejected_path) \
+                if op.isfile(rejected_path) else 0
+            _write_checkpoint(checkpoint_path, checkpoint)
+            seconds = perf_counter() - start
+            click.echo(
+                "{rows} rows, {inserted} new, {rejected} rejected".format(
+                    **checkpoint
+                ) + " ({0:.0f} rows/s)".format(len(chunk) / seconds)
+            )
+            start = perf_counter()
+        if op.isfile(checkpoint_path):
+            os.remove(checkpoint_path)
+        if checkpoint['rejected']:
+            click.echo("Rejected rows written to " + rejected_path)
+        click.echo("Run 'flask purchases detect-languages' to detect the "
+                   "languages of the imported purchases")
+
+    @purchases.command('detect-languages')
+    @click.option('--batch-size', default=500, show_default=True,
+                  help="Number of purchases per batch.")
+    @click.option('--redetect-unknown', is_flag=True,
+                  help="Also process purchases with empty language.")
+    def detect_languages(batch_size: int, redetect_unknown: bool):
+        """Detect the languages of purchases without language, e.g. after an
+        import. Every distinct subject is detected only once.
+        """
+        updated = detect_pending_languages(batch_size, redetect_unknown)
+        click.echo("Detected languages of {0} purchases".format(updated))
+
+    @purchases.command('rebuild-summary')
+    def rebuild_summary():
+        """Rebuild the monthly summary rollup from all purchases."""
+        MonthlySummary.rebuild()
+        click.echo("Rebuilt {0} monthly summary rows".format(
+            MonthlySummary.query.count()
+        ))
+
+    @purchases.command('settle')
+    @click.option('--since', type=click.DateTime(['%Y-%m-%d']),
+                  help="First purchase date included.")
+    @click.option('--until', type=click.DateTime(['%Y-%m-%d']),
+                  help="First purchase date excluded.")
+    def settle_flat(since, until):
+        """Show if the purchases of the flat mates are in balance and the
+        transfers which settle the flat.
+        """
+        settlement = settle(since, until)
+        click.echo("Fair share: {0:.2f}".format(settlement.share))
+        for member, paid, balance in zip(settlement.members,
+                                         settlement.paid,
+                                         settlement.balance):
+            click.echo("{0:<20} paid {1:>10.2f}  balance {2:>+10.2f}".format(
+                member, paid, balance
+            ))
+        for debtor, creditor, amount in settlement.transfers:
+            click.echo("{0} pays {1} {2:.2f}".format(debtor, creditor, amount))
+        if not settlement.transfers:
+            click.echo("The flat is in balance")
+
+    @purchases.command('export')
+    @click.argument('path')
+    @click.option('--format', 'format_', default='csv', show_default=True,
+                  type=click.Choice(sorted(formats)),
+                  help="';' separated .csv as read by import, or NDJSON.")
+    @click.option('--gzip', 'compress', is_flag=True,
+                  help="Compress the output with gzip.")
+    @click.option('--since', type=click.DateTime(['%Y-%m-%d']),
+                  help="First purchase date included.")
+    @click.option('--until', type=click.DateTime(['%Y-%m-%d']),
+                  help="First purchase date excluded.")
+    def export(path: str, format_: str, compress: bool, since, until):
+        """Export purchases to a file, streamed at constant memory.
+
+        :param path: Path of the export file, '-' for stdout.
+        :type path: str
+        """
+        start = perf_counter()
+        size = 0
+        with click.open_file(path, 'wb') as f:
+            for chunk in export_purchases(format_, compress, since, until):
+                f.write(chunk)
+                size += len(chunk)
+        if path != '-':
+            click.echo("Exported {0:.1f} kB to {1} in {2:.1f}s".format(
+                size / 1024, path, perf_counter() - start
+            ))
+
+    @purchases.command('snapshot')
+    @click.argument('path', required=False)
+    def snapshot(path: str):
+        """Write all purchases to a memory mapped columnar snapshot, the
+        flat report starts from it without scanning the purchase table.
+
+        :param path: Snapshot path, PURCHASE_SNAPSHOT_PATH if not given.
+        :type path: str
+        """
+        from app import data_version
+        from app.flat_report.cache import PurchaseCache
+
+        path = path or app.config['PURCHASE_SNAPSHOT_PATH']
+        start = perf_counter()
+        generation = data_version.generation()
+        meta = write_snapshot(path, PurchaseCache.fetch(), generation)
+        click.echo("Wrote snapshot of {0} purchases to {1} in {2:.1f}s".format(
+            meta['rows'], path, perf_counter() - start
+        ))
+
+
+def _write_checkpoint(path: str, checkpoint: dict):
+    """Replace checkpoint file atomically, so a crash never leaves a
+    truncated checkpoint behind.
+    :param path: Path of checkpoint file.
+    :type path: str.
+    :param checkpoint: Processed, inserted and rejected row counts.
+    :type checkpoint: dict.
+    """
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(path + '.tmp', path)
@@ -0,0 +1,115 @@
+"""Version token of the purchase data shared by all processes. Writes flag
+the session with :meth:`DataVersion.mark_changed` and the token is replaced
+after their transaction commits, so caches keyed on the token invalidate
+in every worker at once. A second generation token only changes with writes
+which rewrite existing purchase data, caches of the purchase rows reload
+on a new generation and otherwise just fetch the added purchases.
+
+.. module:: data_version
+   :platform: Unix, Windows
+   :synopsis: Cross process purchase data version.
+
+:Classes:
+
+    :class:`DataVersion`
+"""
+
+import os
+import os.path as op
+import tempfile
+from uuid import uuid4
+from sqlalchemy import event
+
+
+class DataVersion(object):
+    """Flask extension keeping the data version token in a small file.
+
+    :Config:
+
+        :param DATA_VERSION_PATH: Path of the version file.
+        :type DATA_VERSION_PATH: str
+    """
+
+    def __init__(self, app=None):
+        self.path = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app import db
+
+        self.path = app.config.get(
+            'DATA_VERSION_PATH',
+            op.join(app.instance_path, 'data_version')
+        )
+        if not event.contains(db.session, 'after_commit', self._after_commit):
+            event.listen(db.session, 'after_commit', self._after_commit)
+            event.listen(
+                db.session,
+                'after_soft_rollback',
+                self._after_rollback
+            )
+
+    def current(self):
+        """Current version token, created on first use."""
+        try:
+            with open(self.path) as f:
+                return f.read()
+        except (IOError, OSError):
+            return self.bump()
+
+    def generation(self):
+        """Current generation token. It only changes with writes which
+        rewrite existing purchase data, not with writes which just add
+        purchases or change data outside of the purchase rows shown by the
+        report, e.g. languages.
+        """
+        try:
+            with open(self.path + '.generation') as f:
+                return f.read()
+        except (IOError, OSError):
+            return self._write(self.path + '.generation')
+
+    def bump(self, rewrite: bool = True):
+        """Replace the version token atomically, with rewrite first the
+        generation token. Readers which see the new version token therefore
+        also see the new generation.
+        """
+        if rewrite:
+            self._write(self.path + '.generation')
+        return self._write(self.path)
+
+    @staticmethod
+    def _write(path: str):
+        token = uuid4().hex
+        directory = op.dirname(path)
+        if directory and not op.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory or '.')
+        with os.fdopen(fd, 'w') as f:
+            f.write(token)
+        os.replace(tmp_path, path)
+        return token
+
+    @staticmethod
+    def mark_changed(rewrite: bool = True):
+        """Flag the current transaction as writing purchase data.
+
+        :param rewrite: False if the transaction only adds purchases, users
+                        or shops or changes columns the purchase cache of
+                        the flat report does not hold, so the cache only
+                        needs to fetch the new purchases.
+        :type rewrite: bool
+        """
+        from app import db
+
+        db.session.info['data_changed'] = \
+            db.session.info.get('data_changed', False) or rewrite
+
+    def _after_commit(self, session):
+        if 'data_changed' in session.info:
+            self.bump(session.info.pop('data_changed'))
+
+    @staticmethod
+    def _after_rollback(session, previous_transaction):
+        session.info.pop('data_changed', None)
@@ -0,0 +1,54 @@
+"""WSGI dispatching of sub-apps mounted below a path prefix of the main app.
+The sub-app is created on the first request below its prefix, so processes
+that never serve it, e.g. CLI commands and migrations, do not pay for its
+imports and setup.
+
+.. module:: dispatch
+   :platform: Unix, Windows
+   :synopsis: Lazily created WSGI sub-apps.
+
+:Classes:
+
+    :class:`LazyDispatcher`
+"""
+
+from threading import Lock
+
+
+class LazyDispatcher(object):
+    """WSGI middleware passing requests below prefix to a sub-app created on
+    first use and all other requests to the wrapped app. The prefix is moved
+    from PATH_INFO to SCRIPT_NAME like in
+    :class:`werkzeug.wsgi.DispatcherMiddleware`.
+
+    :param app: Wrapped WSGI app.
+    :type app: callable
+    :param prefix: Path prefix of the sub-app without trailing slash.
+    :type prefix: str
+    :param factory: Callable returning the sub-app WSGI app.
+    :type factory: callable
+    """
+
+    def __init__(self, app, prefix, factory):
+        self.app = app
+        self.prefix = prefix.rstrip('/')
+        self.factory = factory
+        self._sub_app = None
+        self._lock = Lock()
+
+    @property
+    def sub_app(self):
+        """Sub-app, created on first access."""
+        if self._sub_app is None:
+            with self._lock:
+                if self._sub_app is None:
+                    self._sub_app = self.factory()
+        return self._sub_app
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(self.prefix + '/'):
+            return self.app(environ, start_response)
+        environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + self.prefix
+        environ['PATH_INFO'] = path[len(self.prefix):]
+        return self.sub_app(environ, start_response)
@@ -1,20 +1,231 @@
-from threading import Thread
+"""Email delivery through a bounded queue and a fixed pool of worker
+threads. Every worker keeps its SMTP connection open while messages arrive,
+sends the queued messages in batches over it and closes it after an idle
+timeout. Failed deliveries are retried with exponential backoff on a new
+connection.
+
+.. module:: email
+   :platform: Unix, Windows
+   :synopsis: Pooled email delivery.
+
+:Classes:
+
+    :class:`EmailDispatcher`
+
+:Functions:
+
+    :func:`send_email`
+
+:Attributes:
+
+    :param email_dispatcher: Email dispatcher of the process.
+    :type email_dispatcher: EmailDispatcher
+"""
+
+import atexit
+import smtplib
+from queue import Queue, Empty, Full
+from threading import Lock, Thread
+from time import sleep
 from flask import current_app
 from flask_mail import Message
-from app import mail
+from app import mail, metrics
+
+_stop = object()
+
+
+class EmailDispatcher(object):
+    """Flask extension delivering emails with a fixed worker pool.
+
+    :Config:
+
+        :param EMAIL_WORKERS: Number of worker threads.
+        :type EMAIL_WORKERS: int
+        :param EMAIL_QUEUE_SIZE: Maximum number of queued messages.
+        :type EMAIL_QUEUE_SIZE: int
+        :param EMAIL_BATCH_SIZE: Maximum messages a worker takes at once.
+        :type EMAIL_BATCH_SIZE: int
+        :param EMAIL_MAX_RETRIES: Retries of a failed delivery.
+        :type EMAIL_MAX_RETRIES: int
+        :param EMAIL_RETRY_BACKOFF: Seconds before the first retry, doubled
+                                    for every further retry.
+        :type EMAIL_RETRY_BACKOFF: float
+        :param EMAIL_IDLE_TIMEOUT: Seconds an idle SMTP connection is kept.
+        :type EMAIL_IDLE_TIMEOUT: int
+        :param EMAIL_ENQUEUE_TIMEOUT: Seconds to wait for room in a full
+                                      queue before a message is dropped.
+        :type EMAIL_ENQUEUE_TIMEOUT: float
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.queue = Queue()
+        self.workers = []
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self._lock = Lock()
+        self._exit_registered = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.worker_count = app.config.get('EMAIL_WORKERS', 2)
+        self.batch_size = app.config.get('EMAIL_BATCH_SIZE', 20)
+        self.max_retries = app.config.get('EMAIL_MAX_RETRIES', 3)
+        self.retry_backoff = app.config.get('EMAIL_RETRY_BACKOFF', 1.)
+        self.idle_timeout = app.config.get('EMAIL_IDLE_TIMEOUT', 30)
+        self.enqueue_timeout = app.config.get('EMAIL_ENQUEUE_TIMEOUT', 5.)
+        self.queue = Queue(maxsize=app.config.get('EMAIL_QUEUE_SIZE', 100))
+        metrics.register(
+            'purchase_tracer_email_queue_depth',
+            'Emails waiting for delivery.',
+            self.depth
+        )
+        metrics.register(
+            'purchase_tracer_emails_sent_total',
+            'Delivered emails.',
+            lambda: self.sent,
+            'counter'
+        )
+        metrics.register(
+            'purchase_tracer_emails_failed_total',
+            'Emails dropped after all retries or on a full queue.',
+            lambda: self.failed + self.dropped,
+            'counter'
+        )
+        if not self._exit_registered:
+            atexit.register(self.shutdown)
+            self._exit_registered = True
+
+    def depth(self):
+        """Number of queued messages."""
+        return self.queue.qsize()
+
+    def submit(self, msg):
+        """Queue a message for delivery, starting the workers on first use.
+
+        :param msg: Message to send.
+        :type msg: flask_mail.Message
+        :returns: False if the queue stayed full and the message is dropped.
+        :rtype: bool
+        """
+        self._start()
+        try:
+            self.queue.put(msg, timeout=self.enqueue_timeout)
+        except Full:
+            with self._lock:
+                self.dropped += 1
+            current_app.logger.error(
+                "email queue full, dropped message to {0}".format(
+                    ', '.join(msg.recipients)
+                )
+            )
+            return False
+        return True
+
+    def shutdown(self, timeout: float = 10.):
+        """Let the workers deliver the queued messages and stop them."""
+        with self._lock:
+            workers, self.workers = self.workers, []
+        for _ in workers:
+            self.queue.put(_stop)
+        for worker in workers:
+            worker.join(timeout)
+
+    def _start(self):
+        with self._lock:
+            self.workers = [
+                worker for worker in self.workers if worker.is_alive()
+            ]
+            for i in range(len(self.workers), self.worker_count):
+                worker = Thread(
+                    target=self._work,
+                    name='email-worker-{0}'.format(i),
+                    daemon=True
+                )
+                worker.start()
+                self.workers.append(worker)
+
+    def _work(self):
+        connection = None
+        while True:
+            try:
+                msg = self.queue.get(
+                    timeout=self.idle_timeout if connection else None
+                )
+            except Empty:
+                connection = self._close(connection)
+                continue
+            batch = [msg]
+            while batch[-1] is not _stop and len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            with self.app.app_context():
+                for msg in batch:
+                    if msg is not _stop:
+                        connection = self._send(connection, msg)
+                    self.queue.task_done()
+            if batch[-1] is _stop:
+                self._close(connection)
+                return
+
+    def _send(self, connection, msg):
+        for attempt in range(self.max_retries + 1):
+            try:
+                if connection is None:
+                    connection = mail.connect()
+                    connection.__enter__()
+                connection.send(msg)
+                with self._lock:
+                    self.sent += 1
+                return connection
+            except (smtplib.SMTPException, OSError) as e:
+                connection = self._close(connection)
+                if attempt == self.max_retries:
+                    with self._lock:
+                        self.failed += 1
+                    current_app.logger.error(
+                        "email to {0} failed: {1}".format(
+                            ', '.join(msg.recipients), e
+                        )
+                    )
+                    return None
+                current_app.logger.warning(
+                    "email to {0} failed, retry {1}: {2}".format(
+                        ', '.join(msg.recipients), attempt + 1, e
+                    )
+                )
+                sleep(self.retry_backoff * 2 ** attempt)
+            except Exception:
+                # a broken message, e.g. bad header, is not retried and must
+                # not end the worker
+                connection = self._close(connection)
+                with self._lock:
+                    self.failed += 1
+                current_app.logger.exception(
+                    "email to {0} failed".format(', '.join(msg.recipients))
+                )
+                return None
+
+    @staticmethod
+    def _close(connection):
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except (smtplib.SMTPException, OSError):
+                pass
+        return None
 
 
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
+email_dispatcher = EmailDispatcher()
 
 
-# noinspection PyProtectedMember
 def send_email(subject, sender, recipients, text_body, html_body):
     msg = Message(subject, sender=sender, recipients=recipients)
     msg.body = text_body
     msg.html = html_body
-    Thread(
-        target=send_async_email,
-        args=(current_app._get_current_object(), msg)
-    ).start()
+    email_dispatcher.submit(msg)
@@ -0,0 +1,135 @@
+"""Streaming export of all purchases. Rows are read with a server side cursor
+in batches of :data:`batch_size` and encoded chunk by chunk, as ';' separated
+.csv in the format read by :meth:`app.models.Purchase._load_from_csv` or as
+NDJSON, optionally gzip compressed on the fly. Memory use is independent of
+the number of purchases.
+
+.. module:: export
+   :platform: Unix, Windows
+   :synopsis: Streaming purchase export.
+
+:Functions:
+
+    :func:`purchase_rows`
+    :func:`export_purchases`
+
+:Attributes:
+
+    :param formats: Mimetype of each export format.
+    :type formats: dict
+"""
+
+import csv
+import io
+import json
+import zlib
+from app import db
+from app.models import User, Shop, Purchase, purchases_table
+
+
+batch_size = 1000
+formats = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+_columns = ['user', 'purchaser', 'purchase_date', 'shop', 'subject', 'value']
+
+
+def purchase_rows(since=None, until=None):
+    """Iterate over all purchases ordered by id with a server side cursor.
+
+    :param since: First purchase date included.
+    :type since: datetime
+    :param until: First purchase date excluded.
+    :type until: datetime
+    :returns: Rows with the columns of :data:`_columns`.
+    :rtype: iterator
+    """
+    purchaser = db.aliased(User)
+    query = db.session.query(
+        User.username,
+        purchaser.username,
+        Purchase.purchase_date,
+        Shop.shopname,
+        Purchase.subject,
+        Purchase.value
+    ).join(
+        User, Purchase.user_id == User.id
+    ).join(
+        Shop, Purchase.shop_id == Shop.id
+    ).outerjoin(
+        purchases_table, purchases_table.c.purchase_id == Purchase.id
+    ).outerjoin(
+        purchaser, purchases_table.c.purchaser_id == purchaser.id
+    )
+    if since is not None:
+        query = query.filter(Purchase.purchase_date >= since)
+    if until is not None:
+        query = query.filter(Purchase.purchase_date < until)
+    return query.order_by(Purchase.id).yield_per(batch_size)
+
+
+def _date(value):
+    return value.strftime('%Y-%m-%d') if value is not None else ''
+
+
+def _csv_chunks(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';', lineterminator='\n')
+    writer.writerow(_columns)
+    for count, (user, purchaser, purchase_date, shop, subject, value) \
+            in enumerate(rows, 1):
+        writer.writerow([
+            user, purchaser or '', _date(purchase_date), shop, subject, value
+        ])
+        if count % batch_size == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def _ndjson_chunks(rows):
+    lines = []
+    for user, purchaser, purchase_date, shop, subject, value in rows:
+        lines.append(json.dumps(dict(
+            user=user,
+            purchaser=purchaser,
+            purchase_date=_date(purchase_date) or None,
+            shop=shop,
+            subject=subject,
+            value=value
+        ), ensure_ascii=False))
+        if len(lines) == batch_size:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_purchases(format: str = 'csv', compress: bool = False,
+                     since=None, until=None):
+    """Encode all purchases chunk by chunk.
+
+    :param format: 'csv' or 'ndjson', see :data:`formats`.
+    :type format: str
+    :param compress: Compress the output with gzip.
+    :type compress: bool
+    :returns: Encoded chunks.
+    :rtype: iterator
+    :raises: ValueError for unknown formats.
+    """
+    if format not in formats:
+        raise ValueError("unknown export format {0}".format(format))
+    rows = purchase_rows(since, until)
+    chunks = _csv_chunks(rows) if format == 'csv' else _ndjson_chunks(rows)
+    return _gzip_chunks(chunks) if compress else chunks
@@ -0,0 +1,175 @@
+"""Process-wide columnar cache of the purchase table for the flat report.
+The purchases are loaded once into a pandas frame with categorical user,
+purchaser, shop and subject columns, float32 values and datetime64 dates.
+Once the data version of :mod:`app.data_version` changes, the next read only
+fetches purchases above the id high-water mark of the frame, so report
+callbacks do not scan the purchase table again. Writes which rewrite
+existing purchase data change the data generation and reload the frame.
+A load starts from the snapshot of :mod:`app.snapshot` at
+PURCHASE_SNAPSHOT_PATH if it was written in the current generation. Its
+memory mapped columns are used as they are, so all workers share the page
+cached snapshot, and only purchases above its high-water mark are fetched
+and appended to a copy of the frame.
+
+.. module:: flat_report.cache
+   :platform: Unix, Windows
+   :synopsis: Columnar in-memory purchase cache.
+
+:Classes:
+
+    :class:`PurchaseCache`
+
+:Attributes:
+
+    :param purchase_cache: Cache instance of the process.
+    :type purchase_cache: PurchaseCache
+"""
+
+from threading import Lock
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from flask import current_app
+from app import db, data_version
+from app.models import User, Shop, Purchase, purchases_table
+from app.snapshot import load_snapshot
+
+
+_categories = ['user', 'purchaser', 'shop', 'subject']
+_columns = ['id', 'timestamp', 'purchase_date', 'value'] + _categories
+
+
+class PurchaseCache(object):
+    """Purchase frame with incremental refresh."""
+
+    def __init__(self):
+        self._frame = None
+        self._high_water = 0
+        self._version = None
+        self._generation = None
+        self._lock = Lock()
+
+    def frame(self):
+        """Return the purchase frame, fetch new purchases if the data version
+        changed. The frame is shared, do not modify it in place.
+
+        :rtype: pd.DataFrame
+        """
+        with self._lock:
+            version = data_version.current()
+            if self._frame is None or version != self._version:
+                self._refresh()
+                self._version = version
+            return self._frame
+
+    def invalidate(self):
+        """Drop the frame, the next read loads all purchases again."""
+        with self._lock:
+            self._frame = None
+            self._high_water = 0
+
+    def memory_usage(self):
+        """Bytes used by the frame including categories."""
+        if self._frame is None:
+            return 0
+        return int(self._frame.memory_usage(deep=True).sum())
+
+    def _refresh(self):
+        generation = data_version.generation()
+        if generation != self._generation:
+            # existing rows changed, e.g. a removed purchaser or a new name
+            self._frame = None
+            self._high_water = 0
+            self._generation = generation
+        if self._frame is None:
+            self._load_snapshot(generation)
+        new = self.fetch(self._high_water)
+        if self._frame is None:
+            self._frame = new
+        elif not new.empty:
+            self._frame = _concat(self._frame, new)
+        if not self._frame.empty:
+            self._high_water = int(self._frame['id'].max())
+        current_app.logger.info(
+            "purchase cache: {0} rows, {1:.1f} kB".format(
+                len(self._frame),
+                self.memory_usage() / 1024
+            )
+        )
+
+    def _load_snapshot(self, generation):
+        """Start the frame from the snapshot if it was written in
+        generation."""
+        path = current_app.config.get('PURCHASE_SNAPSHOT_PATH')
+        snapshot = load_snapshot(path) if path else None
+        if snapshot is None:
+            return
+        if snapshot.meta.get('generation') != generation:
+            current_app.logger.info(
+                "purchase cache: ignore outdated snapshot of {0}".format(
+                    snapshot.meta['created']
+                )
+            )
+            return
+        self._frame = snapshot.frame()
+        self._high_water = snapshot.meta['high_water']
+        current_app.logger.info(
+            "purchase cache: {0} rows mapped from snapshot {1}".format(
+                len(self._frame), path
+            )
+        )
+
+    @staticmethod
+    def fetch(after_id: int = 0):
+        """Purchases above after_id as frame with the cache columns.
+
+        :rtype: pd.DataFrame
+        """
+        purchaser = db.aliased(User)
+        rows = db.session.query(
+            Purchase.id,
+            Purchase.timestamp,
+            Purchase.purchase_date,
+            Purchase.value,
+            User.username,
+            purchaser.username,
+            Shop.shopname,
+            Purchase.subject
+        ).join(
+            User, Purchase.user_id == User.id
+        ).join(
+            Shop, Purchase.shop_id == Shop.id
+        ).outerjoin(
+            purchases_table, purchases_table.c.purchase_id == Purchase.id
+        ).outerjoin(
+            purchaser, purchases_table.c.purchaser_id == purchaser.id
+        ).filter(
+            Purchase.id > after_id
+        ).order_by(Purchase.id).all()
+        frame = pd.DataFrame.from_records(rows, columns=_columns)
+        return frame.astype(dict(
+            id=np.int64,
+            timestamp='datetime64[ns]',
+            purchase_date='datetime64[ns]',
+            value=np.float32,
+            **{column: 'category' for column in _categories}
+        ))
+
+
+def _concat(frame, new):
+    """Append new rows to frame keeping categorical columns categorical."""
+    columns = {}
+    for column in _columns:
+        if column in _categories:
+            columns[column] = union_categoricals(
+                [frame[column], new[column]],
+                ignore_order=True
+            )
+        else:
+            columns[column] = np.concatenate(
+                [frame[column].values, new[column].values]
+            )
+    return pd.DataFrame(columns, columns=_columns)
+
+
+purchase_cache = PurchaseCache()
@@ -1,16 +1,85 @@
+import dash_html_components as html
 from dash.dependencies import Input, Output
-import pandas_datareader as pdr
-from datetime import datetime as dt
+from app.flat_report.cache import purchase_cache
+from app.flat_report.memo import callback_memo
+from app.flat_report.tables import purchase_page
+from app import db
+from app.models import User, MonthlySummary
+from app.settlement import settle_frame
 
 
 def register_callbacks(dashapp):
+    callback_memo.init_app(dashapp.server)
+
     @dashapp.callback(Output('my-graph', 'figure'), [Input('my-dropdown', 'value')])
+    @callback_memo.memoize
     def update_graph(selected_dropdown_value):
-        df = pdr.get_data_yahoo(selected_dropdown_value, start=dt(2017, 1, 1), end=dt.now())
+        query = db.session.query(
+            MonthlySummary.month,
+            db.func.sum(MonthlySummary.total)
+        ).group_by(MonthlySummary.month).order_by(MonthlySummary.month)
+        if selected_dropdown_value:
+            query = query.join(
+                User, MonthlySummary.purchaser_id == User.id
+            ).filter(User.username == selected_dropdown_value)
+        monthly = query.all()
         return {
             'data': [{
-                'x': df.index,
-                'y': df.Close
+                'x': [month for month, total in monthly],
+                'y': [total for month, total in monthly],
+                'type': 'bar'
             }],
             'layout': {'margin': {'l': 40, 'r': 0, 't': 20, 'b': 30}}
         }
+
+    @dashapp.callback(Output('my-dropdown', 'options'), [Input('url', 'pathname')])
+    @callback_memo.memoize
+    def update_purchasers(pathname):
+        purchasers = purchase_cache.frame().purchaser.cat.categories
+        return [{'label': name, 'value': name} for name in sorted(purchasers)]
+
+    @dashapp.callback(Output('cache-info', 'children'), [Input('my-graph', 'figure')])
+    @callback_memo.memoize
+    def update_cache_info(figure):
+        df = purchase_cache.frame()
+        return "{0} purchases cached, {1:.1f} kB".format(
+            len(df),
+            purchase_cache.memory_usage() / 1024
+        )
+
+    @dashapp.callback(
+        Output('purchases_table', 'data'),
+        [Input('purchases_table', 'pagination_settings'),
+         Input('purchases_table', 'filter'),
+         Input('purchases_table', 'sort_by')])
+    @callback_memo.memoize
+    def update_purchases_table(pagination_settings, filter, sort_by):
+        return purchase_page(pagination_settings, filter, sort_by)
+
+    @dashapp.callback(Output('settlement', 'children'), [Input('url', 'pathname')])
+    @callback_memo.memoize
+    def update_settlement(pathname):
+        members = [user.username for user in User.get_user_list()]
+        settlement = settle_frame(purchase_cache.frame(), members)
+        rows = [
+            html.Tr([
+                html.Td(member),
+                html.Td("{0:.2f}".format(paid)),
+                html.Td("{0:+.2f}".format(balance))
+            ])
+            for member, paid, balance in zip(settlement.members,
+                                             settlement.paid,
+                                             settlement.balance)
+        ]
+        return [
+            html.H3("Settlement"),
+            html.P("Fair share: {0:.2f}".format(settlement.share)),
+            html.Table(
+                [html.Tr([html.Th("Member"), html.Th("Paid"), html.Th("Balance")])] + rows,
+                className='table table-sm'
+            ),
+            html.Ul([
+                html.Li("{0} pays {1} {2:.2f}".format(*transfer))
+                for transfer in settlement.transfers
+            ] or [html.Li("The flat is in balance")])
+        ]
@@ -1,6 +1,7 @@
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
+from app.flat_report.tables import purchases_table
 # from flask import redirect, url_for
 
 
@@ -33,14 +34,13 @@ body = dbc.Container(
                         html.H1("Flat Report"),
                         dcc.Dropdown(
                             id='my-dropdown',
-                            options=[
-                                {'label': 'Coke', 'value': 'COKE'},
-                                {'label': 'Tesla', 'value': 'TSLA'},
-                                {'label': 'Apple', 'value': 'AAPL'}
-                            ],
-                            value='COKE'
+                            options=[],
+                            placeholder="All purchasers"
                         ),
-                        dcc.Graph(id='my-graph')
+                        dcc.Graph(id='my-graph'),
+                        html.P(id='cache-info', className='text-muted'),
+                        html.Div(id='settlement'),
+                        purchases_table
                     ]
                 )
             ]
@@ -49,4 +49,4 @@ body = dbc.Container(
     className='mt-4'
 )
 
-layout = html.Div([navbar, body])
+layout = html.Div([dcc.Location(id='url', refresh=False), navbar, body])
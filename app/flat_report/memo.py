@@ -0,0 +1,140 @@
+"""Memoization of flat report callbacks. Results are keyed by callback name,
+callback inputs and the purchase data version of :mod:`app.data_version`,
+so every purchase write invalidates them. The results are kept in a size
+bounded LRU, either in process or in a SQLite file shared by all workers.
+
+.. module:: flat_report.memo
+   :platform: Unix, Windows
+   :synopsis: Memoized Dash callbacks.
+
+:Classes:
+
+    :class:`MemoryBackend`
+    :class:`SQLiteBackend`
+    :class:`CallbackMemo`
+
+:Attributes:
+
+    :param callback_memo: Memo of the flat report callbacks.
+    :type callback_memo: CallbackMemo
+"""
+
+import json
+import pickle
+import sqlite3
+from collections import OrderedDict
+from functools import wraps
+from hashlib import sha256
+from threading import Lock
+from time import time
+from app import data_version
+
+
+class MemoryBackend(object):
+    """LRU of results in the current process."""
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, version):
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+class SQLiteBackend(object):
+    """LRU of results in a SQLite file shared by all workers. Entries of
+    older data versions are dropped on write."""
+
+    def __init__(self, size, path):
+        self.size = size
+        self._store = sqlite3.connect(path, check_same_thread=False)
+        self._store.execute(
+            'CREATE TABLE IF NOT EXISTS memo ('
+            'key TEXT PRIMARY KEY, value BLOB, version TEXT, used REAL)'
+        )
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock, self._store:
+            row = self._store.execute(
+                'SELECT value FROM memo WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None:
+                self._store.execute(
+                    'UPDATE memo SET used = ? WHERE key = ?', (time(), key)
+                )
+        return row[0] if row is not None else None
+
+    def set(self, key, value, version):
+        with self._lock, self._store:
+            self._store.execute(
+                'INSERT OR REPLACE INTO memo VALUES (?, ?, ?, ?)',
+                (key, value, version, time())
+            )
+            self._store.execute(
+                'DELETE FROM memo WHERE version != ? OR key IN ('
+                'SELECT key FROM memo ORDER BY used DESC '
+                'LIMIT -1 OFFSET ?)',
+                (version, self.size)
+            )
+
+
+class CallbackMemo(object):
+    """Flask extension memoizing Dash callbacks.
+
+    :Config:
+
+        :param REPORT_MEMO_SIZE: Maximum number of memoized results.
+        :type REPORT_MEMO_SIZE: int
+        :param REPORT_MEMO_PATH: SQLite file shared by all workers, empty to
+                                 memoize in process only.
+        :type REPORT_MEMO_PATH: str
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        size = app.config.get('REPORT_MEMO_SIZE', 256)
+        path = app.config.get('REPORT_MEMO_PATH', '')
+        self.backend = SQLiteBackend(size, path) if path \
+            else MemoryBackend(size)
+
+    def memoize(self, func):
+        """Decorate a callback to return memoized results for equal inputs
+        of the same data version."""
+        @wraps(func)
+        def memoized(*args):
+            version = data_version.current()
+            key = sha256(json.dumps(
+                [func.__name__, args, version],
+                sort_keys=True,
+                default=str
+            ).encode('utf-8')).hexdigest()
+            value = self.backend.get(key)
+            if value is not None:
+                self.hits += 1
+                return pickle.loads(value)
+            self.misses += 1
+            result = func(*args)
+            self.backend.set(key, pickle.dumps(result), version)
+            return result
+        return memoized
+
+
+callback_memo = CallbackMemo()
@@ -1,18 +1,29 @@
-import pandas as pd
-import dash
+import re
+from datetime import datetime
 import dash_table
-from dash.dependencies import Input, Output
-from app.models import Purchase
+from sqlalchemy import and_
+from app.models import User, Shop, Purchase, purchases_table as purchases_links
 from app import db
 
 
 _page_size = 5
-_purchase_df =
+
+_purchaser = db.aliased(User)
+_columns = [
+    ('id', 'Id', Purchase.id),
+    ('purchase_date', 'Date', Purchase.purchase_date),
+    ('user', 'User', User.username),
+    ('purchaser', 'Purchaser', _purchaser.username),
+    ('shop', 'Shop', Shop.shopname),
+    ('subject', 'Subject', Purchase.subject),
+    ('value', 'Value', Purchase.value)
+]
+_column_expressions = {id: expression for id, name, expression in _columns}
 
 purchases_table = dash_table.DataTable(
     id='purchases_table',
     columns=[
-        {'name': i, 'id': i, 'deletable': True} for i in sorted(df.columns)
+        {'name': name, 'id': id} for id, name, expression in _columns
     ],
     pagination_settings={
         'current_page': 0,
@@ -36,4 +47,149 @@ operators = [['ge ', '>='],
              ['ne ', '!='],
              ['eq ', '='],
              ['contains '],
-             ['datestartswith ']]
\ No newline at end of file
+             ['datestartswith ']]
+
+
+_operator_names = {
+    alias.strip(): operator_type[0].strip()
+    for operator_type in operators for alias in operator_type
+}
+_filter_part = re.compile(
+    r'^\s*\{(?P<name>[^}]*)\}\s*(?P<operator>' +
+    '|'.join(re.escape(alias) for alias in
+             sorted(_operator_names, key=len, reverse=True)) +
+    r')(?:\s+|(?<=[=<>])\s*)(?P<value>.*?)\s*$'
+)
+_numeric_columns = {'id', 'value'}
+
+
+def split_filter_part(filter_part):
+    """Split one part of a table filter expression like "{value} ge 10". The
+    operator is read right after the column, so operator names inside the
+    value stay part of the value. Values are strings, only compared values
+    of numeric columns are converted to numbers.
+
+    :returns: Column id, operator name and value or None for each if the part
+              is no "{column} operator value" expression.
+    :rtype: tuple
+    :raises: ValueError for a non numeric value of a numeric column.
+    """
+    match = _filter_part.match(filter_part)
+    if match is None:
+        return None, None, None
+    name = match.group('name')
+    operator = _operator_names[match.group('operator')]
+    value = match.group('value')
+    v0 = value[:1]
+    if len(value) > 1 and v0 == value[-1] and v0 in ("'", '"', '`'):
+        value = value[1: -1].replace('\\' + v0, v0)
+    if name in _numeric_columns and \
+            operator not in ('contains', 'datestartswith'):
+        value = float(value)
+    return name, operator, value
+
+
+def _date_range(prefix):
+    """Turn a date prefix 'YYYY', 'YYYY-MM' or 'YYYY-MM-DD' into the start
+    of the period and the start of the next period."""
+    prefix = str(prefix).strip()
+    if len(prefix) >= 10:
+        start = datetime.strptime(prefix[:10], '%Y-%m-%d')
+        return start, datetime.fromordinal(start.toordinal() + 1)
+    if len(prefix) >= 7:
+        start = datetime.strptime(prefix[:7], '%Y-%m')
+        return start, start.replace(
+            year=start.year + start.month // 12,
+            month=start.month % 12 + 1
+        )
+    start = datetime.strptime(prefix[:4], '%Y')
+    return start, start.replace(year=start.year + 1)
+
+
+def _like(value):
+    """Escape the LIKE wildcards of a filter value."""
+    return str(value).replace('\\', '\\\\').replace(
+        '%', '\\%'
+    ).replace('_', '\\_')
+
+
+def _filter_condition(expression, operator, value):
+    """Build a SQL condition for one split filter part."""
+    if expression is Purchase.purchase_date and operator != 'contains':
+        if operator == 'datestartswith':
+            start, end = _date_range(value)
+            return and_(expression >= start, expression < end)
+        value = _date_range(value)[0]
+    elif operator == 'datestartswith':
+        return expression.like('{0}%'.format(_like(value)), escape='\\')
+    if operator == 'contains':
+        return expression.ilike('%{0}%'.format(_like(value)), escape='\\')
+    return {
+        'ge': expression.__ge__,
+        'le': expression.__le__,
+        'lt': expression.__lt__,
+        'gt': expression.__gt__,
+        'ne': expression.__ne__,
+        'eq': expression.__eq__
+    }[operator](value)
+
+
+def purchase_query(filter='', sort_by=()):
+    """Compile filter expression and sort columns of the purchases table into
+    one SQL query over purchases, authors, shops and purchasers.
+
+    :param filter: Dash table filter expression, parts joined by ' && '.
+    :type filter: str
+    :param sort_by: Dash table sort columns with column_id and direction.
+    :type sort_by: list
+    :rtype: sqlalchemy.orm.Query
+    """
+    query = db.session.query(
+        *[expression for id, name, expression in _columns]
+    ).join(
+        User, Purchase.user_id == User.id
+    ).join(
+        Shop, Purchase.shop_id == Shop.id
+    ).outerjoin(
+        purchases_links, purchases_links.c.purchase_id == Purchase.id
+    ).outerjoin(
+        _purchaser, purchases_links.c.purchaser_id == _purchaser.id
+    )
+    for filter_part in (filter or '').split(' && '):
+        try:
+            id, operator, value = split_filter_part(filter_part)
+            if id not in _column_expressions:
+                continue
+            query = query.filter(
+                _filter_condition(_column_expressions[id], operator, value)
+            )
+        except ValueError:
+            continue
+    order = [
+        _column_expressions[col['column_id']].desc()
+        if col['direction'] == 'desc'
+        else _column_expressions[col['column_id']].asc()
+        for col in sort_by or [] if col['column_id'] in _column_expressions
+    ]
+    return query.order_by(*(order + [Purchase.id.desc()]))
+
+
+def purchase_page(pagination_settings, filter='', sort_by=()):
+    """Fetch only the requested page of the purchases table.
+
+    :param pagination_settings: Dash table current_page and page_size.
+    :type pagination_settings: dict
+    :returns: Table rows as records.
+    :rtype: list
+    """
+    page = pagination_settings['current_page']
+    size = pagination_settings['page_size']
+    rows = purchase_query(filter, sort_by).limit(size).offset(page * size)
+    return [
+        dict(
+            zip([id for id, name, expression in _columns], row),
+            purchase_date=row.purchase_date.strftime('%Y-%m-%d')
+            if row.purchase_date else None
+        )
+        for row in rows
+    ]
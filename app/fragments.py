@@ -0,0 +1,120 @@
+"""Cache of rendered template fragments like the purchase and member cards.
+A fragment is keyed by template, object id, locale and the version of the
+object, which covers every value the fragment shows, so a changed purchase,
+shop or user never hits an old fragment, also in other processes. Entries
+of objects changed through the session are dropped right after the flush.
+The cache is a size bounded LRU per process.
+
+.. module:: fragments
+   :platform: Unix, Windows
+   :synopsis: Rendered fragment cache.
+
+:Classes:
+
+    :class:`FragmentCache`
+"""
+
+from collections import OrderedDict, defaultdict
+from threading import Lock
+from flask import render_template, g, Markup
+from sqlalchemy import event
+
+
+class FragmentCache(object):
+    """Flask extension caching rendered fragments. The templates render
+    fragments with the ``render_fragment(template, obj, **context)`` global.
+
+    :Config:
+
+        :param FRAGMENT_CACHE_SIZE: Maximum number of cached fragments.
+        :type FRAGMENT_CACHE_SIZE: int
+    """
+
+    def __init__(self, app=None):
+        self.size = 4096
+        self.hits = 0
+        self.misses = 0
+        self._fragments = {}
+        self._entries = OrderedDict()
+        self._by_object = defaultdict(set)
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app import db
+
+        self.size = app.config.get('FRAGMENT_CACHE_SIZE', 4096)
+        app.jinja_env.globals['render_fragment'] = self.render
+        if not event.contains(db.session, 'after_flush', self._after_flush):
+            event.listen(db.session, 'after_flush', self._after_flush)
+
+    def fragment(self, template: str, name: str, version, depends):
+        """Register a cacheable fragment template.
+
+        :param template: Template name, e.g. '_purchase.html'.
+        :type template: str
+        :param name: Name of the object in the template context.
+        :type name: str
+        :param version: Called with the object and the render context,
+                        returns a hashable version of all shown values.
+        :type version: callable
+        :param depends: Called with the object, returns (table name, id) of
+                        every row the fragment shows.
+        :type depends: callable
+        """
+        self._fragments[template] = (name, version, depends)
+
+    def render(self, template: str, obj, **context):
+        """Rendered fragment of obj from cache or rendered now.
+
+        :rtype: Markup
+        """
+        name, version, depends = self._fragments[template]
+        key = (
+            template,
+            obj.id,
+            str(g.get('locale')),
+            version(obj, **context)
+        )
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        context[name] = obj
+        html = Markup(render_template(template, **context))
+        dependencies = depends(obj)
+        with self._lock:
+            self._entries[key] = (html, dependencies)
+            for dependency in dependencies:
+                self._by_object[dependency].add(key)
+            while len(self._entries) > self.size:
+                self._drop(*self._entries.popitem(last=False))
+        return html
+
+    def invalidate(self, table: str, id: int):
+        """Drop all fragments showing the row id of table."""
+        with self._lock:
+            for key in list(self._by_object.get((table, id), ())):
+                self._drop(key, self._entries.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_object.clear()
+
+    def _drop(self, key, entry):
+        for dependency in entry[1]:
+            keys = self._by_object[dependency]
+            keys.discard(key)
+            if not keys:
+                del self._by_object[dependency]
+
+    def _after_flush(self, session, flush_context):
+        for obj in list(session.dirty) + list(session.deleted):
+            table = getattr(obj, '__table__', None)
+            if table is not None and getattr(obj, 'id', None) is not None:
+                self.invalidate(table.name, obj.id)
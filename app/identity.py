@@ -0,0 +1,85 @@
+"""Short lived cache of the users loaded by Flask-Login. The column values
+of a loaded user are kept per process for a few seconds and merged back into
+the session of later requests without a query. Changes of a profile or a
+password invalidate the cached entry explicitly.
+
+.. module:: identity
+   :platform: Unix, Windows
+   :synopsis: Identity cache of the logged in users.
+
+:Classes:
+
+    :class:`IdentityCache`
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from sqlalchemy.orm import make_transient_to_detached
+
+
+class IdentityCache(object):
+    """Flask extension caching users by id for the user loader.
+
+    :Config:
+
+        :param USER_CACHE_TTL: Seconds a loaded user is served from cache.
+        :type USER_CACHE_TTL: int
+        :param USER_CACHE_SIZE: Maximum number of cached users.
+        :type USER_CACHE_SIZE: int
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 30
+        self.size = 1024
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('USER_CACHE_TTL', 30)
+        self.size = app.config.get('USER_CACHE_SIZE', 1024)
+
+    def get(self, id: int):
+        """User of id attached to the current session, loaded from the
+        database only if not cached or expired.
+
+        :rtype: app.models.User
+        """
+        from app import db
+        from app.models import User
+
+        with self._lock:
+            entry = self._entries.get(id)
+            if entry is not None and monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(id)
+                values = entry[1]
+            else:
+                values = None
+        if values is not None:
+            user = User(**values)
+            make_transient_to_detached(user)
+            return db.session.merge(user, load=False)
+
+        user = User.query.get(id)
+        if user is not None:
+            values = {
+                column.key: getattr(user, column.key)
+                for column in User.__table__.columns
+            }
+            with self._lock:
+                self._entries[id] = (monotonic(), values)
+                self._entries.move_to_end(id)
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, id: int):
+        """Drop the cached user of id, e.g. after a profile change."""
+        with self._lock:
+            self._entries.pop(id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
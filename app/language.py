@@ -0,0 +1,152 @@
+"""Detect the language of purchase subjects outside of the request path.
+New purchases are stored with language NULL. A background stage processes
+them in batches and detects every distinct subject only once, since
+subjects like "Groceries" or "Rent" repeat a lot. An empty language marks
+subjects without detectable language.
+
+.. module:: language
+   :platform: Unix, Windows
+   :synopsis: Batch language detection of purchase subjects.
+
+:Classes:
+
+    :class:`LanguageDetector`
+
+:Functions:
+
+    :func:`detect_language`
+    :func:`detect_pending_languages`
+"""
+
+from functools import lru_cache
+from threading import Event, Lock, Thread
+from guess_language import guess_language
+from flask import request_started
+from sqlalchemy import bindparam
+
+
+@lru_cache(maxsize=4096)
+def detect_language(subject):
+    """Guess language of a subject.
+
+    :returns: ISO639 language identifier or '' if unknown.
+    :rtype: str
+    """
+    language = guess_language(subject or '')
+    if language == 'UNKNOWN' or len(language) > 5:
+        language = ''
+    return language
+
+
+def detect_pending_languages(batch_size=500, redetect_unknown=False):
+    """Detect languages of all purchases without language in batches of
+    purchases read in id order, every distinct subject is detected only
+    once. Rows are updated by primary key and only if the language changed.
+
+    :param batch_size: Number of purchases per batch.
+    :type batch_size: int
+    :param redetect_unknown: Also process purchases with empty language,
+                             e.g. rows of old .csv imports.
+    :type redetect_unknown: bool
+    :returns: Number of updated purchases.
+    :rtype: int
+    """
+    from app import db, data_version
+    from app.models import Purchase
+
+    table = Purchase.__table__
+    pending = table.c.language.is_(None)
+    if redetect_unknown:
+        pending = pending | (table.c.language == '')
+    last_id = 0
+    updated = 0
+    while True:
+        rows = db.session.execute(
+            db.select([table.c.id, table.c.subject, table.c.language]).where(
+                pending
+            ).where(
+                table.c.id > last_id
+            ).order_by(table.c.id).limit(batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        changes = []
+        for id, subject, language in rows:
+            detected = detect_language(subject)
+            if detected != language:
+                changes.append(dict(_id=id, _language=detected))
+        if changes:
+            db.session.execute(
+                table.update().where(
+                    table.c.id == bindparam('_id')
+                ).values(language=bindparam('_language')),
+                changes
+            )
+            data_version.mark_changed(rewrite=False)
+            updated += len(changes)
+        db.session.commit()
+    return updated
+
+
+class LanguageDetector(object):
+    """Flask extension running :func:`detect_pending_languages` in a
+    background thread. The thread is started by the first request of the
+    app or the first :meth:`notify`, so it also backfills imported purchases
+    while CLI commands and migrations never start it.
+
+    :Config:
+
+        :param LANGUAGE_DETECTION_INTERVAL: Seconds between two runs if no
+                                            new purchase is notified.
+        :type LANGUAGE_DETECTION_INTERVAL: int
+        :param LANGUAGE_DETECTION_BATCH: Purchases per batch.
+        :type LANGUAGE_DETECTION_BATCH: int
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.interval = 300
+        self.batch_size = 500
+        self._wake = Event()
+        self._lock = Lock()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get(
+            'LANGUAGE_DETECTION_INTERVAL',
+            self.interval
+        )
+        self.batch_size = app.config.get(
+            'LANGUAGE_DETECTION_BATCH',
+            self.batch_size
+        )
+        request_started.connect(self._request_started, app)
+
+    def _request_started(self, sender, **extra):
+        if self._thread is None:
+            self.notify()
+
+    def notify(self):
+        """Wake the background stage after purchases were inserted."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            with self.app.app_context():
+                try:
+                    detect_pending_languages(self.batch_size)
+                except Exception:
+                    self.app.logger.exception("language detection failed")
+                finally:
+                    from app import db
+                    db.session.remove()
@@ -0,0 +1,102 @@
+"""Write-behind tracking of the users last_seen time stamp. Requests only
+note the time in memory, coalesced per user. The noted times are written
+with one bulk update when the flush interval has passed, so an active user
+causes one write per interval instead of a commit per request.
+
+.. module:: last_seen
+   :platform: Unix, Windows
+   :synopsis: Batch last_seen updates of users.
+
+:Classes:
+
+    :class:`LastSeen`
+"""
+
+import atexit
+from datetime import datetime, timedelta
+from threading import Lock
+from sqlalchemy import bindparam
+
+
+class LastSeen(object):
+    """Flask extension which buffers last_seen time stamps per user.
+
+    :Config:
+
+        :param LAST_SEEN_FLUSH_INTERVAL: Seconds between two flushes of the
+                                         buffered time stamps.
+        :type LAST_SEEN_FLUSH_INTERVAL: int
+        :param LAST_SEEN_MIN_DELTA: Seconds a stored last_seen needs to be
+                                    old before a user is buffered again.
+        :type LAST_SEEN_MIN_DELTA: int
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._pending = {}
+        self._lock = Lock()
+        self._last_flush = datetime.utcnow()
+        self.flush_interval = timedelta(seconds=60)
+        self.min_delta = timedelta(seconds=60)
+        self._exit_registered = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.flush_interval = timedelta(
+            seconds=app.config.get('LAST_SEEN_FLUSH_INTERVAL', 60)
+        )
+        self.min_delta = timedelta(
+            seconds=app.config.get('LAST_SEEN_MIN_DELTA', 60)
+        )
+        if not self._exit_registered:
+            atexit.register(self._flush_on_exit)
+            self._exit_registered = True
+
+    def touch(self, user):
+        """Note that user is seen now and flush if the interval passed.
+
+        :param user: Authenticated user.
+        :type user: app.models.User
+        """
+        now = datetime.utcnow()
+        with self._lock:
+            if user.id not in self._pending and user.last_seen is not None \
+                    and now - user.last_seen < self.min_delta:
+                return
+            self._pending[user.id] = now
+            due = now - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered time stamps with one bulk update."""
+        from app import db
+        from app.models import User
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = datetime.utcnow()
+        if not pending:
+            return
+        table = User.__table__
+        with db.engine.begin() as conn:
+            # never move last_seen back, other workers may have written a
+            # newer time stamp
+            conn.execute(
+                table.update().where(
+                    table.c.id == bindparam('user_id')
+                ).where(
+                    (table.c.last_seen.is_(None)) |
+                    (table.c.last_seen < bindparam('seen'))
+                ).values(last_seen=bindparam('seen')),
+                [
+                    dict(user_id=user_id, seen=seen)
+                    for user_id, seen in pending.items()
+                ]
+            )
+
+    def _flush_on_exit(self):
+        with self.app.app_context():
+            self.flush()
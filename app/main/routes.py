@@ -1,25 +1,99 @@
-from datetime import datetime
+import re
+from hashlib import md5
 from flask import render_template, flash, redirect, url_for, request, g, \
-    jsonify, current_app
+    jsonify, current_app, abort, Response, stream_with_context
 from flask_login import current_user, login_required
 from flask_babel import get_locale
 from flask_babel import lazy_gettext as _l
-from guess_language import guess_language
-from app import db
+from app import db, last_seen, translation_cache, language_detector, \
+    metrics, identity_cache, avatar_store, fragment_cache, data_version
 from app.main.forms import EditProfileForm, PurchaseForm
 from app.models import User, Purchase, Shop
-from app.translate import translate
+from app.pagination import paginate_cursor
+from app.export import export_purchases, formats
 from app.main import bp
 
 
 @bp.before_app_request
 def before_request():
     if current_user.is_authenticated:
-        current_user.last_seen = datetime.utcnow()
-        db.session.commit()
+        last_seen.touch(current_user._get_current_object())
     g.locale = str(get_locale())
 
 
+def _purchase_version(purchase, **context):
+    return (
+        purchase.author.username,
+        purchase.author.email,
+        purchase.timestamp,
+        purchase.purchase_date,
+        purchase.buyer.username if purchase.buyer else None,
+        purchase.seller.shopname,
+        purchase.subject,
+        purchase.value,
+        purchase.language
+    )
+
+
+def _purchase_depends(purchase):
+    depends = [
+        ('purchase', purchase.id),
+        ('user', purchase.user_id),
+        ('shop', purchase.shop_id)
+    ]
+    if purchase.buyer is not None:
+        depends.append(('user', purchase.buyer.id))
+    return depends
+
+
+def _member_version(member, stats):
+    return (
+        member.username,
+        member.email,
+        member.last_seen,
+        tuple(sorted(stats[member.id].items()))
+    )
+
+
+fragment_cache.fragment(
+    '_purchase.html', 'purchase', _purchase_version, _purchase_depends
+)
+fragment_cache.fragment(
+    '_member.html', 'member', _member_version,
+    lambda member: [('user', member.id)]
+)
+
+
+def _paginate_purchases(query, endpoint, **values):
+    """Paginate a purchase feed query in the configured FEED_PAGINATION mode.
+    'offset' uses page numbers, 'cursor' uses keyset pagination with opaque
+    after/before tokens, see :mod:`app.pagination`.
+
+    :returns: Purchases of the page, next_url and prev_url.
+    :rtype: tuple
+    """
+    per_page = current_app.config['ELEMENTS_PER_PAGE']
+    if current_app.config['FEED_PAGINATION'] == 'cursor':
+        purchases = paginate_cursor(
+            query,
+            per_page,
+            after=request.args.get('after'),
+            before=request.args.get('before')
+        )
+        next_url = url_for(endpoint, after=purchases.next_cursor, **values) \
+            if purchases.has_next else None
+        prev_url = url_for(endpoint, before=purchases.prev_cursor, **values) \
+            if purchases.has_prev else None
+    else:
+        page = request.args.get('page', 1, type=int)
+        purchases = query.paginate(page, per_page, False)
+        next_url = url_for(endpoint, page=purchases.next_num, **values) \
+            if purchases.has_next else None
+        prev_url = url_for(endpoint, page=purchases.prev_num, **values) \
+            if purchases.has_prev else None
+    return purchases.items, next_url, prev_url
+
+
 @bp.route('/', methods=['GET', 'POST'])
 @bp.route('/index', methods=['GET', 'POST'])
 @login_required
@@ -30,9 +104,6 @@ def index():
             User.id != current_user.id).all()
     ]
     if form.validate_on_submit():
-        language = guess_language(form.subject.data)
-        if language == 'UNKNOWN' or len(language) > 5:
-            language = ''
         shopname = form.shopname.data
         shop = Shop.query.filter_by(shopname=shopname).first()
         if shop is None:
@@ -46,30 +117,24 @@ def index():
             value=form.value.data,
             seller=shop,
             subject=form.subject.data,
-            author=current_user,
-            language=language
+            author=current_user
         )
         purchaser.add_purchase(purchase)
         db.session.add(purchase)
         db.session.commit()
+        language_detector.notify()
         flash(_l("Your purchase is traced now!"))
         return redirect(url_for('main.index'))
     else:
-        page = request.args.get('page', 1, type=int)
-        purchases = current_user.followed_purchases().paginate(
-            page,
-            current_app.config['ELEMENTS_PER_PAGE'],
-            False
+        purchases, next_url, prev_url = _paginate_purchases(
+            current_user.followed_purchases(),
+            'main.index'
         )
-        next_url = url_for('main.index', page=purchases.next_num) \
-            if purchases.has_next else None
-        prev_url = url_for('main.index', page=purchases.prev_num) \
-            if purchases.has_prev else None
         return render_template(
             'index.html',
             title=_l("Home Page"),
             form=form,
-            purchases=purchases.items,
+            purchases=purchases,
             next_url=next_url,
             prev_url=prev_url
         )
@@ -78,20 +143,14 @@ def index():
 @bp.route('/explore')
 @login_required
 def explore():
-    page = request.args.get('page', 1, type=int)
-    purchases = Purchase.query.order_by(Purchase.timestamp.desc()).paginate(
-        page,
-        current_app.config['ELEMENTS_PER_PAGE'],
-        False
+    purchases, next_url, prev_url = _paginate_purchases(
+        Purchase.get_purchase_list(),
+        'main.explore'
     )
-    next_url = url_for('main.explore', page=purchases.next_num) \
-        if purchases.has_next else None
-    prev_url = url_for('main.explore', page=purchases.prev_num) \
-        if purchases.has_prev else None
     return render_template(
         'index.html',
         title=_l('Explore'),
-        purchases=purchases.items,
+        purchases=purchases,
         next_url=next_url,
         prev_url=prev_url
     )
@@ -118,6 +177,7 @@ def members():
         'members.html',
         title=_l('Members'),
         members=users.items,
+        stats=User.get_member_stats(users.items),
         next_url=next_url,
         prev_url=prev_url
     )
@@ -128,26 +188,15 @@ def members():
 @login_required
 def user(username):
     user = User.query.filter_by(username=username).first_or_404()
-    page = request.args.get('page', 1, type=int)
-    purchases = user.bought_purchases().paginate(
-        page,
-        current_app.config['ELEMENTS_PER_PAGE'],
-        False
-    )
-    next_url = url_for(
-        'main.user',
-        username=user.username,
-        page=purchases.next_num
-    ) if purchases.has_next else None
-    prev_url = url_for(
+    purchases, next_url, prev_url = _paginate_purchases(
+        user.bought_purchases(),
         'main.user',
-        username=user.username,
-        page=purchases.prev_num
-    ) if purchases.has_prev else None
+        username=user.username
+    )
     return render_template(
         'user.html',
         user=user,
-        purchases=purchases.items,
+        purchases=purchases,
         next_url=next_url,
         prev_url=prev_url
     )
@@ -158,9 +207,13 @@ def user(username):
 def edit_profile():
     form = EditProfileForm(current_user.username)
     if form.validate_on_submit():
+        data_version.mark_changed(
+            rewrite=form.username.data != current_user.username
+        )
         current_user.username = form.username.data
         current_user.remindings = form.remindings.data
         db.session.commit()
+        identity_cache.invalidate(current_user.id)
         flash(_l("Your changes have been saved."))
         return redirect(url_for('main.edit_profile'))
     elif request.method == 'GET':
@@ -214,7 +267,7 @@ def unfollow(username):
 def translate_text():
     return jsonify(
         dict(
-            text=translate(
+            text=translation_cache.translate(
                 request.form['text'],
                 src=request.form['source_language'],
                 dest=request.form['dest_language']
@@ -223,7 +276,100 @@ def translate_text():
     )
 
 
+@bp.route('/translate/batch', methods=['Post'])
+@login_required
+def translate_batch():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400)
+    dest = data.get('dest_language') or g.locale
+    ids = data.get('purchases', [])
+    if not isinstance(dest, str) or not isinstance(ids, list) \
+            or len(ids) > current_app.config['TRANSLATION_BATCH_MAX']:
+        abort(400)
+    try:
+        ids = [int(id) for id in ids]
+    except (TypeError, ValueError):
+        abort(400)
+    purchases = db.session.query(
+        Purchase.id,
+        Purchase.subject,
+        Purchase.language
+    ).filter(
+        Purchase.id.in_(ids),
+        Purchase.language != '',
+        Purchase.language != dest
+    ).all()
+    translated = translation_cache.translate_many(
+        [(p.subject, p.language) for p in purchases],
+        dest
+    )
+    return jsonify(
+        dict(
+            translations={
+                p.id: translated[(p.subject, p.language)] for p in purchases
+            }
+        )
+    )
+
+
+@bp.route('/translate/stats')
+@login_required
+def translate_stats():
+    return jsonify(translation_cache.stats())
+
+
+@bp.route('/avatar/<digest>/<int:size>')
+def avatar(digest, size):
+    if not re.match(r'^[0-9a-f]{32}$', digest) \
+            or size not in avatar_store.sizes:
+        abort(404)
+    response = Response(mimetype=avatar_store.mimetype)
+    response.set_etag('{0}-{1}-{2}'.format(
+        digest, size, avatar_store.mimetype.split('/')[1]
+    ))
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 3600
+    if request.if_none_match.contains(response.get_etag()[0]):
+        response.status_code = 304
+        return response
+    image = avatar_store.cached(digest, size)
+    if image is None:
+        # render only avatars of existing users
+        if not any(
+                md5(email.lower().encode('utf-8')).hexdigest() == digest
+                for email, in db.session.query(User.email)):
+            abort(404)
+        image = avatar_store.render(digest, size)
+    response.set_data(image)
+    return response
+
+
+@bp.route('/export/purchases.<format>')
+@login_required
+def export(format):
+    if format not in formats:
+        abort(404)
+    compress = request.args.get('gzip', 0, type=int) == 1
+    filename = 'purchases.' + format + ('.gz' if compress else '')
+    return Response(
+        stream_with_context(export_purchases(format, compress)),
+        mimetype='application/gzip' if compress else formats[format],
+        headers={
+            'Content-Disposition': 'attachment; filename=' + filename
+        }
+    )
+
+
+@bp.route('/metrics')
+@login_required
+def metrics_view():
+    if current_user.email not in current_app.config['ADMINS']:
+        abort(403)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 @bp.route('/flat_report')
 @login_required
 def flat_report():
-    return redirect(url_for('/flat_report/'))
+    return redirect(request.script_root + '/flat_report/')
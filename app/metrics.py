@@ -0,0 +1,207 @@
+"""Per-request timing and SQL instrumentation. SQLAlchemy engine events
+count and time every query, Flask request signals time every request. The
+collected latency histograms and query counters per endpoint are rendered in
+the Prometheus text format, every response gets a Server-Timing header and
+queries slower than a threshold are logged with their SQL text. Metrics are
+kept per process.
+
+.. module:: metrics
+   :platform: Unix, Windows
+   :synopsis: Request and query metrics.
+
+:Classes:
+
+    :class:`Metrics`
+"""
+
+import logging
+from collections import defaultdict
+from threading import Lock
+from time import perf_counter
+from flask import g, request, current_app, has_app_context, \
+    has_request_context, request_started, request_finished
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# upper bounds of the latency histogram buckets in seconds
+buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+
+_background = 'background'
+
+
+class Metrics(object):
+    """Flask extension collecting request and query metrics.
+
+    :Config:
+
+        :param SLOW_QUERY_THRESHOLD: Seconds after which a query is logged as
+                                     slow query.
+        :type SLOW_QUERY_THRESHOLD: float
+    """
+
+    def __init__(self, app=None):
+        self.slow_query_threshold = 0.5
+        self._lock = Lock()
+        self._latency = defaultdict(lambda: [0] * (len(buckets) + 1))
+        self._latency_sum = defaultdict(float)
+        self._queries = defaultdict(int)
+        self._query_time = defaultdict(float)
+        self._slow_queries = 0
+        self._collectors = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.slow_query_threshold = app.config.get('SLOW_QUERY_THRESHOLD', 0.5)
+        request_started.connect(self._request_started, app)
+        request_finished.connect(self._request_finished, app)
+        if not event.contains(Engine, 'before_cursor_execute',
+                              self._before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute',
+                         self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute',
+                         self._after_cursor_execute)
+
+    def register(self, name: str, help: str, collect, type: str = 'gauge'):
+        """Add a metric of another component, e.g. a queue depth, which is
+        collected on every render.
+
+        :param name: Prometheus metric name.
+        :type name: str
+        :param help: Description of the metric.
+        :type help: str
+        :param collect: Callable returning the current value.
+        :type collect: callable
+        :param type: Prometheus metric type, 'gauge' or 'counter'.
+        :type type: str
+        """
+        if name not in [collector[0] for collector in self._collectors]:
+            self._collectors.append((name, help, collect, type))
+
+    def _request_started(self, sender, **extra):
+        g.metrics_start = perf_counter()
+        g.metrics_queries = 0
+        g.metrics_query_time = 0.
+
+    def _request_finished(self, sender, response, **extra):
+        start = g.get('metrics_start')
+        if start is None:
+            return
+        duration = perf_counter() - start
+        endpoint = request.endpoint or 'unmatched'
+        index = next(
+            (i for i, bound in enumerate(buckets) if duration <= bound),
+            len(buckets)
+        )
+        with self._lock:
+            self._latency[endpoint][index] += 1
+            self._latency_sum[endpoint] += duration
+        response.headers.add(
+            'Server-Timing',
+            'app;dur={0:.1f}, db;dur={1:.1f};desc="{2} queries"'.format(
+                duration * 1000,
+                g.metrics_query_time * 1000,
+                g.metrics_queries
+            )
+        )
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                               executemany):
+        conn.info.setdefault('metrics_start', []).append(perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        duration = perf_counter() - conn.info['metrics_start'].pop()
+        if has_request_context() and 'metrics_queries' in g:
+            endpoint = request.endpoint or 'unmatched'
+            g.metrics_queries += 1
+            g.metrics_query_time += duration
+        else:
+            endpoint = _background
+        with self._lock:
+            self._queries[endpoint] += 1
+            self._query_time[endpoint] += duration
+            if duration >= self.slow_query_threshold:
+                self._slow_queries += 1
+            else:
+                return
+        logger = current_app.logger if has_app_context() \
+            else logging.getLogger(__name__)
+        logger.warning("slow query {0:.3f}s in {1}: {2}".format(
+            duration,
+            endpoint,
+            ' '.join(statement.split())
+        ))
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format.
+
+        :rtype: str
+        """
+        with self._lock:
+            latency = {e: list(c) for e, c in self._latency.items()}
+            latency_sum = dict(self._latency_sum)
+            queries = dict(self._queries)
+            query_time = dict(self._query_time)
+            slow_queries = self._slow_queries
+
+        lines = [
+            '# HELP purchase_tracer_request_duration_seconds '
+            'Request latency per endpoint.',
+            '# TYPE purchase_tracer_request_duration_seconds histogram'
+        ]
+        for endpoint in sorted(latency):
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), latency[endpoint]):
+                cumulative += count
+                lines.append(
+                    'purchase_tracer_request_duration_seconds_bucket'
+                    '{{endpoint="{0}",le="{1}"}} {2}'.format(
+                        endpoint, bound, cumulative
+                    )
+                )
+            lines.append(
+                'purchase_tracer_request_duration_seconds_sum'
+                '{{endpoint="{0}"}} {1:.6f}'.format(
+                    endpoint, latency_sum[endpoint]
+                )
+            )
+            lines.append(
+                'purchase_tracer_request_duration_seconds_count'
+                '{{endpoint="{0}"}} {1}'.format(endpoint, cumulative)
+            )
+        lines += [
+            '# HELP purchase_tracer_queries_total '
+            'SQL queries per endpoint.',
+            '# TYPE purchase_tracer_queries_total counter'
+        ]
+        lines += [
+            'purchase_tracer_queries_total{{endpoint="{0}"}} {1}'.format(
+                endpoint, queries[endpoint]
+            ) for endpoint in sorted(queries)
+        ]
+        lines += [
+            '# HELP purchase_tracer_query_duration_seconds_total '
+            'SQL query time per endpoint.',
+            '# TYPE purchase_tracer_query_duration_seconds_total counter'
+        ]
+        lines += [
+            'purchase_tracer_query_duration_seconds_total'
+            '{{endpoint="{0}"}} {1:.6f}'.format(endpoint, query_time[endpoint])
+            for endpoint in sorted(query_time)
+        ]
+        lines += [
+            '# HELP purchase_tracer_slow_queries_total '
+            'SQL queries slower than SLOW_QUERY_THRESHOLD.',
+            '# TYPE purchase_tracer_slow_queries_total counter',
+            'purchase_tracer_slow_queries_total {0}'.format(slow_queries)
+        ]
+        for name, help, collect, type in self._collectors:
+            lines += [
+                '# HELP {0} {1}'.format(name, help),
+                '# TYPE {0} {1}'.format(name, type),
+                '{0} {1}'.format(name, collect())
+            ]
+        return '\n'.join(lines) + '\n'
@@ -20,6 +20,7 @@ only includes ids from data tables as foreign keys.
     :class:`Shop`
     :class:`User`
     :class:`Purchase`
+    :class:`MonthlySummary`
 
 :Attributes:
 
@@ -42,38 +43,46 @@ only includes ids from data tables as foreign keys.
     :mod:`app`
 """
 
-from flask import current_app
+from flask import current_app, url_for
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from hashlib import md5
 import jwt
 from datetime import datetime
-from time import time
-from app import db, login
+from time import time, perf_counter
+from app import db, login, data_version, identity_cache
 import pandas as pd
 import numpy as np
 import os.path as op
+from sqlalchemy import inspect
 
 
 # noinspection PyShadowingBuiltins
 @login.user_loader
 def load_user(id):
-    """Connect db user table with flask login."""
-    return User.query.get(int(id))
+    """Connect db user table with flask login. Users are served from the
+    identity cache, see :mod:`app.identity`."""
+    return identity_cache.get(int(id))
 
 
 # followers association table
 followers = db.Table(
     'followers',
     db.Column('follower_id', db.Integer, db.ForeignKey('user.id')),
-    db.Column('followed_id', db.Integer, db.ForeignKey('user.id'))
+    db.Column('followed_id', db.Integer, db.ForeignKey('user.id')),
+    db.Index('ix_followers_follower_followed', 'follower_id', 'followed_id',
+             unique=True),
+    db.Index('ix_followers_followed_id', 'followed_id')
 )
 
 # purchases association table, user made purchases
 purchases_table = db.Table(
     'purchases_table',
     db.Column('purchaser_id', db.Integer, db.ForeignKey('user.id')),
-    db.Column('purchase_id', db.Integer, db.ForeignKey('purchase.id'))
+    db.Column('purchase_id', db.Integer, db.ForeignKey('purchase.id')),
+    db.Index('ix_purchases_table_purchaser_purchase', 'purchaser_id',
+             'purchase_id', unique=True),
+    db.Index('ix_purchases_table_purchase_id', 'purchase_id')
 )
 
 
@@ -140,17 +149,18 @@ class User(UserMixin, db.Model):
 
     def avatar(self, size):
         digest = md5(self.email.lower().encode('utf-8')).hexdigest()
-        return 'https://www.gravatar.com/avatar/{}?d=identicon&s={}'.format(
-            digest, size
-        )
+        return url_for('main.avatar', digest=digest, size=size)
 
     def add_purchase(self, purchase):
+        new = not inspect(purchase).has_identity
         if not self.bought(purchase):
             self.purchases.append(purchase)
+            MonthlySummary.record(purchase, self, rewrite=not new)
 
     def rm_purchase(self, purchase):
         if self.bought(purchase):
             self.purchases.remove(purchase)
+            MonthlySummary.record(purchase, self, sign=-1)
 
     def bought(self, purchase):
         return self.purchases.filter(
@@ -163,7 +173,9 @@ class User(UserMixin, db.Model):
             (purchases_table.c.purchase_id == Purchase.id)).filter(
             purchases_table.c.purchaser_id == self.id
         )
-        return purchased.order_by(Purchase.timestamp.desc())
+        return Purchase.with_details(
+            purchased.order_by(Purchase.timestamp.desc())
+        )
 
     def follow(self, user):
         if not self.is_following(user):
@@ -185,7 +197,9 @@ class User(UserMixin, db.Model):
             followers.c.follower_id == self.id
         )
         own = Purchase.query.filter_by(user_id=self.id)
-        return followed.union(own).order_by(Purchase.timestamp.desc())
+        return Purchase.with_details(
+            followed.union(own).order_by(Purchase.timestamp.desc())
+        )
 
     def get_reset_password_token(self, expires_in=600):
         return jwt.encode(
@@ -213,6 +227,45 @@ class User(UserMixin, db.Model):
     def get_user_list(cls):
         return User.query.order_by(User.username)
 
+    @classmethod
+    def get_member_stats(cls, users):
+        """Count posts and purchases of several users with grouped aggregate
+        queries instead of loading their purchases. Posts are counted like
+        :meth:`followed_purchases`, own posts plus posts of followed users.
+
+        :param users: Users to collect statistics for.
+        :type users: list
+        :returns: Mapping of user id to dict with posts, purchases and spent.
+        :rtype: dict
+        """
+
+        ids = [user.id for user in users]
+        stats = {id: dict(posts=0, purchases=0, spent=0.) for id in ids}
+        if not ids:
+            return stats
+        followed = {id: {id} for id in ids}
+        for follower_id, followed_id in db.session.query(
+                followers.c.follower_id, followers.c.followed_id).filter(
+                followers.c.follower_id.in_(ids)):
+            followed[follower_id].add(followed_id)
+        authors = set().union(*followed.values())
+        posts = dict(
+            db.session.query(Purchase.user_id, db.func.count(Purchase.id))
+            .filter(Purchase.user_id.in_(authors))
+            .group_by(Purchase.user_id)
+        )
+        for id in ids:
+            stats[id]['posts'] = sum(posts.get(a, 0) for a in followed[id])
+        for purchaser_id, count, spent in db.session.query(
+                purchases_table.c.purchaser_id,
+                db.func.count(Purchase.id),
+                db.func.sum(Purchase.value)).join(
+                Purchase, purchases_table.c.purchase_id == Purchase.id).filter(
+                purchases_table.c.purchaser_id.in_(ids)).group_by(
+                purchases_table.c.purchaser_id):
+            stats[purchaser_id].update(purchases=count, spent=spent or 0.)
+        return stats
+
     def __repr__(self):
         return "<User {}>".format(self.username)
 
@@ -226,10 +279,16 @@ _dtypes = dict(
     value=np.float32
 )
 _csv_path = 'notebooks/purchase_list.csv'
+_purchase_key = ['user_id', 'purchase_date', 'shop_id', 'subject', 'value']
 
 
 class Purchase(db.Model):
     __tablename__ = 'purchase'
+    __table_args__ = (
+        db.Index('ix_purchase_user_id_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_purchase_user_id_purchase_date', 'user_id',
+                 'purchase_date', 'shop_id')
+    )
     id = db.Column(db.Integer, primary_key=True)
     value = db.Column(db.Float)
     subject = db.Column(db.String(64))
@@ -240,43 +299,111 @@ class Purchase(db.Model):
         backref='purchase_user',
         lazy='dynamic'
     )
-    purchase_date = db.Column(db.DateTime)
+    # single purchaser as plain attribute, loadable in bulk for feed pages
+    buyer = db.relationship(
+        'User',
+        secondary=purchases_table,
+        uselist=False,
+        viewonly=True
+    )
+    purchase_date = db.Column(db.DateTime, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    shop_id = db.Column(db.Integer, db.ForeignKey('shop.id'))
+    shop_id = db.Column(db.Integer, db.ForeignKey('shop.id'), index=True)
     language = db.Column(db.String(5))
 
     def __repr__(self):
         return "<Value {}€>".format(str(self.value))
 
     def get_purchaser(self):
-        find_user = User.query.join(
-            purchases_table,
-            (purchases_table.c.purchaser_id == User.id)).filter(
-            purchases_table.c.purchase_id == self.id)
-        return find_user.first()
+        return self.buyer
+
+    @classmethod
+    def with_details(cls, query):
+        """Load author, shop and purchaser of the queried purchases together
+        with the purchases, so rendering a page of purchases does not issue
+        further queries per purchase.
+
+        :param query: Purchase query.
+        :type query: flask_sqlalchemy.BaseQuery
+        :returns: Query with eager loading options.
+        :rtype: flask_sqlalchemy.BaseQuery
+        """
+
+        return query.options(
+            db.joinedload(Purchase.author),
+            db.joinedload(Purchase.seller),
+            db.selectinload(Purchase.buyer)
+        )
+
+    @classmethod
+    def get_purchase_list(cls):
+        return Purchase.with_details(
+            Purchase.query.order_by(Purchase.timestamp.desc())
+        )
 
     # noinspection PyDefaultArgument
     @classmethod
-    def _load_from_csv(cls, path: str = _csv_path, dtypes: dict = _dtypes):
-        """Load purchases from .csv file."""
+    def _load_from_csv(cls, path: str = _csv_path, dtypes: dict = _dtypes,
+                       chunksize: int = None, skip: int = 0):
+        """Load purchases from .csv file.
+
+        :param chunksize: Return an iterator of frames with chunksize rows
+                          each instead of one frame for the whole file.
+        :type chunksize: int
+        :param skip: Number of data rows to skip after the header.
+        :type skip: int
+        """
 
         if not op.isfile(path):
             raise FileNotFoundError(path)
         return pd.read_csv(
-            'notebooks/purchase_list.csv',
+            path,
             sep=';',
             header=0,
             dtype=dtypes,
-            parse_dates=['purchase_date']
+            parse_dates=['purchase_date'],
+            chunksize=chunksize,
+            skiprows=(lambda row: 0 < row <= skip) if skip else None
         )
 
     @classmethod
-    def _add_purchases_from_csv(cls):
+    def _split_unknown_users(cls, frame: pd.DataFrame):
+        """Split a loaded purchase frame into rows with known user and
+        purchaser and rejected rows. Rejected rows get an additional reason
+        column.
+
+        :param frame: Purchases with columns as in :data:`_dtypes`.
+        :type frame: pd.DataFrame
+        :returns: Known rows and rejected rows.
+        :rtype: tuple
+        """
+
+        usernames = set(u for u, in db.session.query(User.username).all())
+        unknown_user = ~frame['user'].isin(usernames)
+        unknown_purchaser = ~frame['purchaser'].isin(usernames)
+        rejected = frame[unknown_user | unknown_purchaser].assign(
+            reason=np.where(
+                unknown_user[unknown_user | unknown_purchaser],
+                'unknown user',
+                'unknown purchaser'
+            )
+        )
+        return frame[~(unknown_user | unknown_purchaser)], rejected
+
+    @classmethod
+    def _add_purchases_from_csv(cls, path: str = _csv_path):
         """Add purchases from .csv file to database table. Works only with
-        known users.
+        known users. Processes the file row by row, see
+        :meth:`_bulk_add_purchases_from_csv` for the vectorized import.
+
+        :returns: Import statistics, see :func:`_import_stats`.
+        :rtype: dict
         """
 
-        for index, row in Purchase._load_from_csv().iterrows():
+        start = perf_counter()
+        frame = Purchase._load_from_csv(path)
+        inserted = 0
+        for index, row in frame.iterrows():
             user = User.query.filter_by(username=row['user']).first()
             if user is None:
                 db.session.rollback()
@@ -307,9 +434,341 @@ class Purchase(db.Model):
                         purchase_date=row['purchase_date'],
                         seller=shop,
                         subject=row['subject'],
-                        value=row['value'],
-                        language=''
+                        value=row['value']
                 )
                 purchaser.add_purchase(purchase)
                 db.session.add(purchase)
+                inserted += 1
+        db.session.commit()
+        return _import_stats('row', len(frame), inserted, start)
+
+    @classmethod
+    def _bulk_add_purchases_from_csv(cls, path: str = _csv_path):
+        """Add purchases from .csv file to database table with bulk inserts.
+        Works only with known users. Same result as
+        :meth:`_add_purchases_from_csv` but with a fixed number of queries
+        independent of the file length.
+
+        :returns: Import statistics, see :func:`_import_stats`.
+        :rtype: dict
+        """
+
+        start = perf_counter()
+        frame = Purchase._load_from_csv(path)
+        inserted = Purchase._bulk_add_purchases(frame)
+        db.session.commit()
+        return _import_stats('bulk', len(frame), inserted, start)
+
+    @classmethod
+    def _bulk_add_purchases(cls, frame: pd.DataFrame):
+        """Add purchases of a loaded purchase frame to the session in one
+        pass. Users and shops are resolved once into lookup maps, rows are
+        deduplicated against the file itself and against the purchases
+        already stored, then purchases and their purchaser links are written
+        with two bulk inserts. The database assigns the purchase ids, they
+        are read back by the purchase key in between. The caller is in
+        charge to commit.
+
+        :param frame: Purchases with columns as in :data:`_dtypes`.
+        :type frame: pd.DataFrame
+        :returns: Number of inserted purchases.
+        :rtype: int
+        :raises: UnknownUserError
+        """
+
+        if frame.empty:
+            return 0
+        users = dict(db.session.query(User.username, User.id).all())
+        for column in ('user', 'purchaser'):
+            unknown = frame.loc[~frame[column].isin(users), column]
+            if not unknown.empty:
+                db.session.rollback()
+                raise UnknownUserError(
+                    "{0} {1} unknown".format(column, unknown.iloc[0])
+                )
+
+        shops = dict(db.session.query(Shop.shopname, Shop.id).all())
+        new_shops = set(frame['shop'].unique()).difference(shops)
+        if new_shops:
+            db.session.execute(
+                Shop.__table__.insert(),
+                [dict(shopname=shopname) for shopname in sorted(new_shops)]
+            )
+            data_version.mark_changed(rewrite=False)
+            shops = dict(db.session.query(Shop.shopname, Shop.id).all())
+
+        frame = frame.assign(
+            user_id=frame['user'].map(users),
+            purchaser_id=frame['purchaser'].map(users),
+            shop_id=frame['shop'].map(shops),
+            value=frame['value'].astype(np.float32)
+        ).drop_duplicates(_purchase_key)
+
+        stored = pd.DataFrame(
+            db.session.query(
+                Purchase.user_id,
+                Purchase.purchase_date,
+                Purchase.shop_id,
+                Purchase.subject,
+                Purchase.value
+            ).filter(
+                Purchase.user_id.in_(frame['user_id'].unique().tolist()),
+                Purchase.purchase_date.between(
+                    frame['purchase_date'].min().to_pydatetime(),
+                    frame['purchase_date'].max().to_pydatetime()
+                )
+            ).all(),
+            columns=_purchase_key
+        ).astype(dict(purchase_date='datetime64[ns]', value=np.float32))
+        frame = frame.merge(
+            stored, on=_purchase_key, how='left', indicator=True
+        )
+        frame = frame[frame['_merge'] == 'left_only']
+        if frame.empty:
+            return 0
+
+        timestamp = datetime.utcnow()
+        db.session.execute(
+            Purchase.__table__.insert(),
+            [
+                dict(
+                    user_id=int(row.user_id),
+                    shop_id=int(row.shop_id),
+                    purchase_date=row.purchase_date.to_pydatetime(),
+                    subject=row.subject,
+                    value=float(row.value),
+                    timestamp=timestamp,
+                    language=None
+                ) for row in frame.itertuples(index=False)
+            ]
+        )
+        # ids are assigned by the database, read them back by the purchase
+        # key among the rows of this insert still without purchaser link
+        inserted = pd.DataFrame(
+            db.session.query(
+                Purchase.id,
+                Purchase.user_id,
+                Purchase.purchase_date,
+                Purchase.shop_id,
+                Purchase.subject,
+                Purchase.value
+            ).outerjoin(
+                purchases_table, purchases_table.c.purchase_id == Purchase.id
+            ).filter(
+                Purchase.timestamp == timestamp,
+                Purchase.user_id.in_(frame['user_id'].unique().tolist()),
+                purchases_table.c.purchase_id.is_(None)
+            ).all(),
+            columns=['id'] + _purchase_key
+        ).astype(dict(purchase_date='datetime64[ns]', value=np.float32))
+        frame = frame.drop(columns='_merge').merge(
+            inserted.drop_duplicates(_purchase_key),
+            on=_purchase_key
+        )
+        db.session.execute(
+            purchases_table.insert(),
+            [
+                dict(purchaser_id=int(purchaser_id), purchase_id=int(id))
+                for purchaser_id, id in zip(frame['purchaser_id'], frame['id'])
+            ]
+        )
+        MonthlySummary.record_frame(frame, rewrite=False)
+        return len(frame)
+
+
+_summary_key = ['month', 'user_id', 'purchaser_id', 'shop_id']
+
+
+class MonthlySummary(db.Model):
+    """Rollup of purchases per month, author, purchaser and shop. Kept up
+    to date in the transaction of every purchaser link added or removed by
+    :meth:`User.add_purchase`, :meth:`User.rm_purchase` and the bulk
+    import, so summaries read a few rows instead of scanning purchases.
+
+    :Attributes:
+
+        :param month: First day of the month of the purchase date.
+        :type month: date
+        :param count: Number of purchases.
+        :type count: int
+        :param total: Sum of purchase values.
+        :type total: float
+    """
+
+    __tablename__ = 'monthly_summary'
+    month = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(
+        db.Integer, db.ForeignKey('user.id'), primary_key=True
+    )
+    purchaser_id = db.Column(
+        db.Integer, db.ForeignKey('user.id'), primary_key=True
+    )
+    shop_id = db.Column(
+        db.Integer, db.ForeignKey('shop.id'), primary_key=True
+    )
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0.)
+
+    def __repr__(self):
+        return "<MonthlySummary {} {}€>".format(self.month, self.total)
+
+    @classmethod
+    def record(cls, purchase, purchaser, sign: int = 1,
+               rewrite: bool = True):
+        """Add (sign 1) or remove (sign -1) one purchase of purchaser. The
+        rewrite flag goes to :meth:`DataVersion.mark_changed`."""
+        db.session.flush()
+        cls._apply([dict(
+            month=purchase.purchase_date.replace(day=1).date()
+            if isinstance(purchase.purchase_date, datetime)
+            else purchase.purchase_date.replace(day=1),
+            user_id=purchase.user_id,
+            purchaser_id=purchaser.id,
+            shop_id=purchase.shop_id,
+            count=sign,
+            total=sign * (purchase.value or 0.)
+        )], rewrite)
+
+    @classmethod
+    def record_frame(cls, frame: pd.DataFrame, sign: int = 1,
+                     rewrite: bool = True):
+        """Add or remove many purchases given as frame with purchase_date,
+        user_id, purchaser_id, shop_id and value columns."""
+        if frame.empty:
+            return
+        groups = frame.assign(
+            month=frame['purchase_date'].dt.to_period('M').dt.to_timestamp()
+        ).groupby(_summary_key)['value'].agg(['count', 'sum']).reset_index()
+        cls._apply([
+            dict(
+                month=row.month.date(),
+                user_id=int(row.user_id),
+                purchaser_id=int(row.purchaser_id),
+                shop_id=int(row.shop_id),
+                count=sign * int(row.count),
+                total=sign * float(row.sum)
+            ) for row in groups.itertuples(index=False)
+        ], rewrite)
+
+    @classmethod
+    def _apply(cls, groups: list, rewrite: bool = True):
+        """Add count and total of groups to the stored rows, insert missing
+        rows and delete rows without purchases left. Uses plain statements
+        only, so it never triggers a flush."""
+        table = cls.__table__
+        months = set(group['month'] for group in groups)
+        stored = set(
+            tuple(row) for row in db.session.execute(
+                db.select([table.c[column] for column in _summary_key])
+                .where(table.c.month.in_(months))
+            )
+        )
+        updates = [
+            dict(('_' + key, value) for key, value in group.items())
+            for group in groups
+            if tuple(group[key] for key in _summary_key) in stored
+        ]
+        inserts = [
+            group for group in groups
+            if tuple(group[key] for key in _summary_key) not in stored
+        ]
+        if updates:
+            db.session.execute(
+                table.update().where(db.and_(*[
+                    table.c[key] == db.bindparam('_' + key)
+                    for key in _summary_key
+                ])).values(
+                    count=table.c.count + db.bindparam('_count'),
+                    total=table.c.total + db.bindparam('_total')
+                ),
+                updates
+            )
+        if inserts:
+            db.session.execute(table.insert(), inserts)
+        db.session.execute(
+            table.delete().where(db.and_(
+                table.c.month.in_(months),
+                table.c.count <= 0
+            ))
+        )
+        data_version.mark_changed(rewrite)
+
+    @classmethod
+    def rebuild(cls, chunksize: int = 50000):
+        """Rebuild the rollup from all purchases, reading them in chunks."""
+        db.session.execute(cls.__table__.delete())
+        query = db.session.query(
+            Purchase.purchase_date,
+            Purchase.user_id,
+            purchases_table.c.purchaser_id,
+            Purchase.shop_id,
+            Purchase.value
+        ).join(
+            purchases_table, purchases_table.c.purchase_id == Purchase.id
+        ).filter(Purchase.purchase_date.isnot(None)).order_by(Purchase.id)
+        groups = []
+        last_id = 0
+        while True:
+            rows = query.filter(Purchase.id > last_id).add_columns(
+                Purchase.id
+            ).limit(chunksize).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            chunk = pd.DataFrame.from_records(
+                rows,
+                columns=['purchase_date', 'user_id', 'purchaser_id',
+                         'shop_id', 'value', 'id']
+            )
+            chunk['month'] = pd.to_datetime(
+                chunk['purchase_date']
+            ).dt.to_period('M').dt.to_timestamp()
+            groups.append(
+                chunk.groupby(_summary_key)['value'].agg(['count', 'sum'])
+            )
+        if groups:
+            summary = pd.concat(groups).groupby(level=_summary_key).sum()
+            db.session.execute(cls.__table__.insert(), [
+                dict(
+                    month=month.date(),
+                    user_id=int(user_id),
+                    purchaser_id=int(purchaser_id),
+                    shop_id=int(shop_id),
+                    count=int(row['count']),
+                    total=float(row['sum'])
+                )
+                for (month, user_id, purchaser_id, shop_id), row
+                in summary.iterrows()
+            ])
+        data_version.mark_changed()
         db.session.commit()
+
+
+def _import_stats(mode: str, rows: int, inserted: int, start: float):
+    """Collect and log throughput of a purchase import.
+
+    :param mode: Import variant, e.g. 'row' or 'bulk'.
+    :type mode: str
+    :param rows: Number of processed .csv rows.
+    :type rows: int
+    :param inserted: Number of new purchases.
+    :type inserted: int
+    :param start: Start time of the import taken by :func:`perf_counter`.
+    :type start: float
+    :returns: Mode, rows, inserted, seconds and rows_per_second.
+    :rtype: dict
+    """
+
+    seconds = perf_counter() - start
+    stats = dict(
+        mode=mode,
+        rows=rows,
+        inserted=inserted,
+        seconds=seconds,
+        rows_per_second=rows / seconds if seconds > 0 else float('inf')
+    )
+    current_app.logger.info(
+        "{mode} import: {rows} rows, {inserted} new purchases in "
+        "{seconds:.3f}s ({rows_per_second:.0f} rows/s)".format(**stats)
+    )
+    return stats
@@ -0,0 +1,129 @@
+"""Keyset (cursor) pagination for purchase feeds. Pages are addressed by an
+opaque cursor of the (timestamp, id) pair of the first or last purchase of a
+neighbouring page instead of a page number. So each page is a seek on the
+timestamp index without OFFSET and COUNT(*) queries, and rows do not shift
+between pages when new purchases arrive.
+
+.. module:: pagination
+   :platform: Unix, Windows
+   :synopsis: Cursor based pagination of purchase queries.
+
+:Classes:
+
+    :class:`CursorPage`
+
+:Functions:
+
+    :func:`encode_cursor`
+    :func:`decode_cursor`
+    :func:`paginate_cursor`
+"""
+
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import datetime
+from sqlalchemy import and_, or_
+from app.models import Purchase
+
+
+_timestamp_format = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def encode_cursor(purchase):
+    """Build an opaque url safe token from timestamp and id of a purchase."""
+    key = '{0}|{1}'.format(
+        purchase.timestamp.strftime(_timestamp_format),
+        purchase.id
+    )
+    return urlsafe_b64encode(key.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(token):
+    """Decode a token of :func:`encode_cursor`.
+
+    :returns: Timestamp and id or None for missing or malformed tokens.
+    :rtype: tuple
+    """
+    if not token:
+        return None
+    try:
+        timestamp, id = urlsafe_b64decode(
+            token.encode('ascii')
+        ).decode('utf-8').split('|')
+        return datetime.strptime(timestamp, _timestamp_format), int(id)
+    except (ValueError, UnicodeError):
+        return None
+
+
+class CursorPage(object):
+    """Page of purchases with cursors to the neighbouring pages.
+
+    :Attributes:
+
+        :param items: Purchases of the page, newest first.
+        :type items: list
+        :param has_next: True if older purchases follow.
+        :type has_next: bool
+        :param has_prev: True if newer purchases precede.
+        :type has_prev: bool
+        :param next_cursor: Token for the page of older purchases.
+        :type next_cursor: str
+        :param prev_cursor: Token for the page of newer purchases.
+        :type prev_cursor: str
+    """
+
+    def __init__(self, items, has_next, has_prev):
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.next_cursor = encode_cursor(items[-1]) \
+            if has_next and items else None
+        self.prev_cursor = encode_cursor(items[0]) \
+            if has_prev and items else None
+
+
+def paginate_cursor(query, per_page, after=None, before=None):
+    """Fetch one page of a purchase query ordered by newest first. Fetches
+    per_page + 1 rows to find out if another page follows without counting.
+
+    :param query: Purchase query, an existing order is replaced.
+    :type query: flask_sqlalchemy.BaseQuery
+    :param per_page: Number of purchases per page.
+    :type per_page: int
+    :param after: Cursor token, page starts with purchases older than it.
+    :type after: str
+    :param before: Cursor token, page ends with purchases newer than it.
+    :type before: str
+    :rtype: CursorPage
+    """
+    query = query.order_by(None)
+    after = decode_cursor(after)
+    before = decode_cursor(before)
+    if before is not None:
+        timestamp, id = before
+        rows = query.filter(or_(
+            Purchase.timestamp > timestamp,
+            and_(Purchase.timestamp == timestamp, Purchase.id > id)
+        )).order_by(
+            Purchase.timestamp.asc(),
+            Purchase.id.asc()
+        ).limit(per_page + 1).all()
+        return CursorPage(
+            rows[:per_page][::-1],
+            has_next=True,
+            has_prev=len(rows) > per_page
+        )
+    if after is not None:
+        timestamp, id = after
+        query = query.filter(or_(
+            Purchase.timestamp < timestamp,
+            and_(Purchase.timestamp == timestamp, Purchase.id < id)
+        ))
+    rows = query.order_by(
+        Purchase.timestamp.desc(),
+        Purchase.id.desc()
+    ).limit(per_page + 1).all()
+    return CursorPage(
+        rows[:per_page],
+        has_next=len(rows) > per_page,
+        has_prev=after is not None
+    )
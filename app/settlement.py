@@ -0,0 +1,131 @@
+"""Check if the purchases of the flat mates are in balance and settle them.
+Every purchase is shared equally by all flat mates (registered users). The
+net balance of a flat mate is what they paid minus their fair share of the
+total. Positive balances are owed money, negative balances owe money. The
+balances are settled with at most n - 1 transfers by repeatedly letting the
+largest debtor pay the largest creditor.
+
+.. module:: settlement
+   :platform: Unix, Windows
+   :synopsis: Vectorized flat balance and settlement.
+
+:Classes:
+
+    :class:`Settlement`
+
+:Functions:
+
+    :func:`settle_arrays`
+    :func:`settle_frame`
+    :func:`settle`
+"""
+
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from app import db
+from app.models import User, Purchase, purchases_table
+
+
+Settlement = namedtuple(
+    'Settlement',
+    ['members', 'paid', 'share', 'balance', 'transfers']
+)
+Settlement.__doc__ = """Balance of the flat.
+
+    :param members: Names of the flat mates.
+    :type members: list
+    :param paid: Sum paid by each flat mate.
+    :type paid: np.ndarray
+    :param share: Fair share of each flat mate.
+    :type share: float
+    :param balance: Paid minus share for each flat mate.
+    :type balance: np.ndarray
+    :param transfers: (debtor, creditor, amount) to settle the flat.
+    :type transfers: list
+"""
+
+
+def settle_arrays(members, purchasers, values, tolerance=0.005):
+    """Compute balances and transfers from purchase arrays.
+
+    :param members: Names of the flat mates.
+    :type members: list
+    :param purchasers: Index into members of the purchaser of each purchase.
+    :type purchasers: np.ndarray
+    :param values: Value of each purchase.
+    :type values: np.ndarray
+    :param tolerance: Balances below are treated as settled.
+    :type tolerance: float
+    :rtype: Settlement
+    """
+    members = list(members)
+    if not members:
+        return Settlement(members, np.zeros(0), 0., np.zeros(0), [])
+    paid = np.bincount(
+        np.asarray(purchasers, dtype=np.intp),
+        weights=np.asarray(values, dtype=np.float64),
+        minlength=len(members)
+    )
+    share = paid.sum() / len(members)
+    balance = paid - share
+
+    transfers = []
+    open_balance = balance.copy()
+    for _ in range(len(members) - 1):
+        debtor = int(np.argmin(open_balance))
+        creditor = int(np.argmax(open_balance))
+        amount = min(-open_balance[debtor], open_balance[creditor])
+        if amount < tolerance:
+            break
+        open_balance[debtor] += amount
+        open_balance[creditor] -= amount
+        transfers.append(
+            (members[debtor], members[creditor], round(float(amount), 2))
+        )
+    return Settlement(members, paid, share, balance, transfers)
+
+
+def settle_frame(frame, members):
+    """Settle the purchases of a purchase frame with a purchaser and a value
+    column, e.g. of :mod:`app.flat_report.cache`. Purchases of purchasers
+    not in members are ignored.
+
+    :rtype: Settlement
+    """
+    codes = pd.Categorical(frame['purchaser'], categories=members).codes
+    known = codes >= 0
+    return settle_arrays(members, codes[known], frame['value'].values[known])
+
+
+def settle(since=None, until=None):
+    """Settle all purchases of the flat, optionally of purchase dates in
+    [since, until) only.
+
+    :param since: First purchase date included.
+    :type since: datetime
+    :param until: First purchase date excluded.
+    :type until: datetime
+    :rtype: Settlement
+    """
+    users = db.session.query(User.id, User.username).order_by(
+        User.username
+    ).all()
+    query = db.session.query(
+        purchases_table.c.purchaser_id,
+        Purchase.value
+    ).join(Purchase, purchases_table.c.purchase_id == Purchase.id)
+    if since is not None:
+        query = query.filter(Purchase.purchase_date >= since)
+    if until is not None:
+        query = query.filter(Purchase.purchase_date < until)
+    rows = np.array(query.all(), dtype=np.float64).reshape(-1, 2)
+    positions = pd.Index([id for id, username in users]).get_indexer(
+        rows[:, 0].astype(np.int64)
+    )
+    known = positions >= 0
+    return settle_arrays(
+        [username for id, username in users],
+        positions[known],
+        np.nan_to_num(rows[known, 1])
+    )
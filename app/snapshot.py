@@ -0,0 +1,184 @@
+"""Columnar snapshot of the purchase table for analytics processes. Every
+column is stored as NumPy .npy file, string columns dictionary encoded as
+integer codes plus a JSON list of categories. Loading maps the .npy files
+read only into memory, so all processes on a host share one page cached
+copy and start without a SQL scan. Every snapshot is written into its own
+directory below the snapshot path and published by replacing the pointer
+file ``current``, so readers never see a half written snapshot. A snapshot
+holds the data generation of :mod:`app.data_version`, it stays usable as
+base for newer purchases until existing purchase data is rewritten.
+
+.. module:: snapshot
+   :platform: Unix, Windows
+   :synopsis: Memory mapped columnar purchase snapshots.
+
+:Classes:
+
+    :class:`Snapshot`
+
+:Functions:
+
+    :func:`write_snapshot`
+    :func:`load_snapshot`
+"""
+
+import json
+import os
+import os.path as op
+import shutil
+import tempfile
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+
+_numeric = ['id', 'timestamp', 'purchase_date', 'value']
+_categories = ['user', 'purchaser', 'shop', 'subject']
+_meta_file = 'meta.json'
+_pointer_file = 'current'
+
+
+def _code_dtype(size: int):
+    for dtype in (np.int8, np.int16, np.int32):
+        if size < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def write_snapshot(path: str, frame: pd.DataFrame, generation: str = None):
+    """Write a purchase frame of :mod:`app.flat_report.cache` as new
+    snapshot below path and publish it. Older snapshots except the one
+    published before are removed, processes which mapped them keep reading
+    the open files.
+
+    :param path: Snapshot path.
+    :type path: str
+    :param frame: Purchases with numeric and categorical columns.
+    :type frame: pd.DataFrame
+    :param generation: Data generation of the frame, see
+                       :meth:`app.data_version.DataVersion.generation`.
+    :type generation: str
+    :returns: Meta data of the snapshot.
+    :rtype: dict
+    """
+    path = op.abspath(path)
+    os.makedirs(path, exist_ok=True)
+    directory = tempfile.mkdtemp(prefix='snapshot-', dir=path)
+    for column in _numeric:
+        np.save(op.join(directory, column + '.npy'), frame[column].values)
+    for column in _categories:
+        categorical = frame[column].astype('category').cat
+        categories = [str(c) for c in categorical.categories]
+        np.save(
+            op.join(directory, column + '.npy'),
+            categorical.codes.values.astype(_code_dtype(len(categories)))
+        )
+        with open(op.join(directory, column + '.categories.json'), 'w',
+                  encoding='utf-8') as f:
+            json.dump(categories, f, ensure_ascii=False)
+    meta = dict(
+        rows=len(frame),
+        high_water=int(frame['id'].max()) if len(frame) else 0,
+        generation=generation,
+        created=datetime.utcnow().isoformat(),
+        numeric=_numeric,
+        categories=_categories
+    )
+    with open(op.join(directory, _meta_file), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    previous = _current(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path)
+    with os.fdopen(fd, 'w') as f:
+        f.write(op.basename(directory))
+    os.replace(tmp_path, op.join(path, _pointer_file))
+    keep = {op.basename(directory), previous}
+    for name in os.listdir(path):
+        if name.startswith('snapshot-') and name not in keep:
+            shutil.rmtree(op.join(path, name), ignore_errors=True)
+    return meta
+
+
+def _current(path: str):
+    """Directory name of the published snapshot or None."""
+    try:
+        with open(op.join(path, _pointer_file)) as f:
+            return f.read().strip() or None
+    except (IOError, OSError):
+        return None
+
+
+class Snapshot(object):
+    """Opened snapshot. The arrays are read only memory maps of the files.
+
+    :Attributes:
+
+        :param meta: Meta data written by :func:`write_snapshot`.
+        :type meta: dict
+        :param arrays: Numeric columns and codes of the string columns.
+        :type arrays: dict
+        :param categories: Categories of each string column.
+        :type categories: dict
+    """
+
+    def __init__(self, meta, arrays, categories):
+        self.meta = meta
+        self.arrays = arrays
+        self.categories = categories
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def column(self, name: str):
+        """Column as array, string columns as pd.Categorical on the mapped
+        codes.
+        """
+        if name in self.categories:
+            return pd.Categorical.from_codes(
+                self.arrays[name],
+                categories=self.categories[name]
+            )
+        return self.arrays[name]
+
+    def frame(self):
+        """Purchase frame with the columns of :mod:`app.flat_report.cache`
+        on the mapped arrays, not copied with pandas 2 or later. The frame
+        is read only.
+
+        :rtype: pd.DataFrame
+        """
+        columns = self.meta['numeric'] + self.meta['categories']
+        return pd.DataFrame(
+            {name: self.column(name) for name in columns},
+            columns=columns,
+            copy=False
+        )
+
+
+def load_snapshot(path: str):
+    """Open the published snapshot below path without reading the columns.
+
+    :returns: Opened snapshot or None if there is none at path or it was
+              removed while opening.
+    :rtype: Snapshot
+    """
+    name = _current(path)
+    if name is None:
+        return None
+    directory = op.join(path, name)
+    try:
+        with open(op.join(directory, _meta_file)) as f:
+            meta = json.load(f)
+        arrays = {
+            column: np.load(op.join(directory, column + '.npy'),
+                            mmap_mode='r')
+            for column in meta['numeric'] + meta['categories']
+        }
+        categories = {}
+        for column in meta['categories']:
+            with open(op.join(directory, column + '.categories.json'),
+                      encoding='utf-8') as f:
+                categories[column] = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    return Snapshot(meta, arrays, categories)
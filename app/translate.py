@@ -1,5 +1,229 @@
-from googletrans import Translator
+"""Translate purchase texts with a pluggable translator backend behind a two
+level cache. The first level is an in-process LRU, the second level a
+persistent SQLite store shared by all processes. Both levels are keyed on
+(text hash, src, dest) and evict by age and size.
 
+.. module:: translate
+   :platform: Unix, Windows
+   :synopsis: Cached translation of purchase texts.
 
-translator = Translator()
-translate = translator.translate
+:Classes:
+
+    :class:`TranslatorBackend`
+    :class:`GoogleTranslator`
+    :class:`FakeTranslator`
+    :class:`TranslationCache`
+"""
+
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from threading import Lock
+from time import time
+
+
+class TranslatorBackend(object):
+    """Interface of translator backends."""
+
+    def translate(self, text, src, dest):
+        """Translate text from language src to language dest.
+
+        :returns: Translated text.
+        :rtype: str
+        """
+        raise NotImplementedError
+
+
+class GoogleTranslator(TranslatorBackend):
+    """Translate with the googletrans client."""
+
+    def __init__(self):
+        from googletrans import Translator
+        self.translator = Translator()
+
+    def translate(self, text, src, dest):
+        return self.translator.translate(text, src=src, dest=dest).text
+
+
+class FakeTranslator(TranslatorBackend):
+    """Local stand-in for tests and offline benchmarks, marks the text with
+    the destination language instead of translating it."""
+
+    def translate(self, text, src, dest):
+        return '[{0}] {1}'.format(dest, text)
+
+
+backends = dict(google=GoogleTranslator, fake=FakeTranslator)
+
+
+class TranslationCache(object):
+    """Flask extension which caches translations of a backend.
+
+    :Config:
+
+        :param TRANSLATION_BACKEND: Name of backend in :data:`backends`.
+        :type TRANSLATION_BACKEND: str
+        :param TRANSLATION_CACHE_SIZE: Entries in the in-process LRU.
+        :type TRANSLATION_CACHE_SIZE: int
+        :param TRANSLATION_CACHE_TTL: Seconds until an entry expires.
+        :type TRANSLATION_CACHE_TTL: int
+        :param TRANSLATION_STORE_PATH: Path of the persistent SQLite store,
+                                       empty to cache in memory only.
+        :type TRANSLATION_STORE_PATH: str
+        :param TRANSLATION_STORE_SIZE: Entries kept in the persistent store.
+        :type TRANSLATION_STORE_SIZE: int
+        :param TRANSLATION_CONCURRENCY: Maximum of parallel backend calls of
+                                        :meth:`translate_many`.
+        :type TRANSLATION_CONCURRENCY: int
+    """
+
+    def __init__(self, app=None, backend=None):
+        self.backend = backend
+        self.size = 1024
+        self.ttl = 30 * 24 * 3600
+        self.store_path = ''
+        self.store_size = 100000
+        self.concurrency = 4
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._store = None
+        self._executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, backend=None):
+        self.size = app.config.get('TRANSLATION_CACHE_SIZE', self.size)
+        self.ttl = app.config.get('TRANSLATION_CACHE_TTL', self.ttl)
+        self.store_path = app.config.get('TRANSLATION_STORE_PATH', '')
+        self.store_size = app.config.get(
+            'TRANSLATION_STORE_SIZE',
+            self.store_size
+        )
+        self.concurrency = app.config.get(
+            'TRANSLATION_CONCURRENCY',
+            self.concurrency
+        )
+        if backend is not None:
+            self.backend = backend
+        elif self.backend is None:
+            self.backend = backends[
+                app.config.get('TRANSLATION_BACKEND', 'google')
+            ]()
+        self._store = None
+
+    @staticmethod
+    def _key(text, src, dest):
+        return '{0}|{1}|{2}'.format(
+            sha256(text.encode('utf-8')).hexdigest(),
+            src,
+            dest
+        )
+
+    def translate(self, text, src, dest):
+        """Translate text from cache or backend.
+
+        :returns: Translated text.
+        :rtype: str
+        """
+        key = self._key(text, src, dest)
+        now = time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        entry = self._load(key, now)
+        if entry is not None:
+            self.store_hits += 1
+        else:
+            self.misses += 1
+            entry = (self.backend.translate(text, src, dest), now)
+            self._save(key, entry)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return entry[0]
+
+    def translate_many(self, texts, dest):
+        """Translate several texts to the same language. Identical texts are
+        translated once, distinct texts concurrently with at most
+        TRANSLATION_CONCURRENCY backend calls at a time.
+
+        :param texts: Pairs of text and source language.
+        :type texts: list
+        :param dest: Destination language.
+        :type dest: str
+        :returns: Mapping of (text, src) pairs to translated texts.
+        :rtype: dict
+        """
+        unique = list(OrderedDict.fromkeys(texts))
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.concurrency
+            )
+        translated = self._executor.map(
+            lambda item: self.translate(item[0], item[1], dest),
+            unique
+        )
+        return dict(zip(unique, translated))
+
+    def stats(self):
+        """Hit and miss counters of both cache levels."""
+        return dict(
+            hits=self.hits,
+            store_hits=self.store_hits,
+            misses=self.misses,
+            entries=len(self._entries)
+        )
+
+    def _connect(self):
+        if self._store is None and self.store_path:
+            self._store = sqlite3.connect(
+                self.store_path,
+                check_same_thread=False
+            )
+            self._store.execute(
+                'CREATE TABLE IF NOT EXISTS translation ('
+                'key TEXT PRIMARY KEY, text TEXT, created REAL)'
+            )
+            self._store.execute(
+                'CREATE INDEX IF NOT EXISTS ix_translation_created '
+                'ON translation (created)'
+            )
+        return self._store
+
+    def _load(self, key, now):
+        with self._lock:
+            store = self._connect()
+            if store is None:
+                return None
+            row = store.execute(
+                'SELECT text, created FROM translation '
+                'WHERE key = ? AND created > ?',
+                (key, now - self.ttl)
+            ).fetchone()
+        return tuple(row) if row is not None else None
+
+    def _save(self, key, entry):
+        with self._lock:
+            store = self._connect()
+            if store is None:
+                return
+            with store:
+                store.execute(
+                    'INSERT OR REPLACE INTO translation VALUES (?, ?, ?)',
+                    (key, entry[0], entry[1])
+                )
+                store.execute(
+                    'DELETE FROM translation WHERE created <= ? OR key IN ('
+                    'SELECT key FROM translation ORDER BY created DESC '
+                    'LIMIT -1 OFFSET ?)',
+                    (entry[1] - self.ttl, self.store_size)
+                )
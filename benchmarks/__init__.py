@@ -0,0 +1,57 @@
+"""Benchmarks of the hot paths of the purchase tracer. A reproducible
+synthetic flat is generated into a SQLite file by :mod:`benchmarks.data`,
+the timed scenarios of :mod:`benchmarks.scenarios` run against it and the
+results are written as JSON, so runs of different commits can be compared.
+
+Run from the repository root::
+
+    python -m benchmarks --users 50 --purchases 20000 --output bench.json
+    python -m benchmarks --compare bench.json --output bench_new.json
+
+.. module:: benchmarks
+   :platform: Unix, Windows
+   :synopsis: Benchmark suite with synthetic flat data.
+
+:Functions:
+
+    :func:`create_benchmark_app`
+"""
+
+import os.path as op
+from dotenv import load_dotenv
+
+basedir = op.abspath(op.join(op.dirname(__file__), op.pardir))
+# config reads the environment on import, load it like flask run does
+load_dotenv(op.join(basedir, '.flaskenv'))
+
+from config import Config  # noqa: E402
+
+
+class BenchmarkConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    TRANSLATION_BACKEND = 'fake'
+    FEED_PAGINATION = 'offset'
+    REPORT_DISPATCH = 'lazy'
+    # memoize in process, scenarios bump the data version for cold runs
+    REPORT_MEMO_PATH = ''
+
+
+def create_benchmark_app(database: str, workdir: str):
+    """Create the app on a benchmark database.
+
+    :param database: Path of the SQLite database file.
+    :type database: str
+    :param workdir: Directory for data version and translation store.
+    :type workdir: str
+    :rtype: flask.Flask
+    """
+
+    from app import create_app
+
+    config_class = type('BenchmarkConfig', (BenchmarkConfig,), dict(
+        SQLALCHEMY_DATABASE_URI='sqlite:///' + op.abspath(database),
+        DATA_VERSION_PATH=op.join(workdir, 'data_version'),
+        TRANSLATION_STORE_PATH=op.join(workdir, 'translations.db')
+    ))
+    return create_app(config_class)
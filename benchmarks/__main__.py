@@ -0,0 +1,122 @@
+"""Command line entry of the benchmarks, see ``python -m benchmarks --help``.
+
+.. module:: benchmarks.__main__
+   :platform: Unix, Windows
+   :synopsis: Generate data, run scenarios and write JSON results.
+"""
+
+import json
+import os
+import os.path as op
+import platform
+import subprocess
+import tempfile
+from datetime import datetime
+import click
+from benchmarks import basedir, create_benchmark_app
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=basedir,
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _compare(results: dict, path: str):
+    with open(path) as f:
+        previous = json.load(f)['results']
+    click.echo("{0:<30} {1:>10} {2:>10} {3:>8}".format(
+        'scenario', 'before', 'after', 'ratio'
+    ))
+    for name, timing in results.items():
+        if name not in previous:
+            continue
+        before = previous[name]['median']
+        click.echo("{0:<30} {1:>10.4f} {2:>10.4f} {3:>8.2f}".format(
+            name, before, timing['median'], timing['median'] / before
+        ))
+
+
+@click.command()
+@click.option('--users', default=20, show_default=True)
+@click.option('--follows', default=5, show_default=True,
+              help="Users followed by every user.")
+@click.option('--shops', default=30, show_default=True)
+@click.option('--purchases', default=10000, show_default=True)
+@click.option('--csv-rows', default=500, show_default=True,
+              help="Rows of the .csv file of the import scenarios.")
+@click.option('--seed', default=0, show_default=True)
+@click.option('--repeat', default=5, show_default=True)
+@click.option('--warmup', default=1, show_default=True)
+@click.option('--scenario', 'names', multiple=True,
+              help="Scenario to run, repeatable, all if not given.")
+@click.option('--workdir', default=None,
+              help="Directory of the generated data, temporary if not given.")
+@click.option('--output', default='benchmark.json', show_default=True)
+@click.option('--compare', default=None,
+              help="Results of an earlier run to compare with.")
+def main(users: int, follows: int, shops: int, purchases: int,
+         csv_rows: int, seed: int, repeat: int, warmup: int, names: tuple,
+         workdir: str, output: str, compare: str):
+    """Generate a synthetic flat, time the scenarios and write the results
+    to output as JSON.
+    """
+
+    from app import db
+    from benchmarks.data import generate, write_purchase_csv
+    from benchmarks.scenarios import Runner, scenarios
+
+    unknown = set(names).difference(scenarios)
+    if unknown:
+        raise click.BadParameter(
+            "unknown scenario {0}, choose from {1}".format(
+                ', '.join(sorted(unknown)), ', '.join(scenarios)
+            )
+        )
+    workdir = workdir or tempfile.mkdtemp(prefix='purchase_tracer_bench_')
+    if not op.isdir(workdir):
+        os.makedirs(workdir)
+    database = op.join(workdir, 'benchmark.db')
+    if op.isfile(database):
+        os.remove(database)
+    csv_path = op.join(workdir, 'purchases.csv')
+
+    app = create_benchmark_app(database, workdir)
+    with app.app_context():
+        counts = generate(users, follows, shops, purchases, seed=seed)
+        write_purchase_csv(csv_path, csv_rows, seed=seed + 1)
+        runner = Runner(app, csv_path, repeat=repeat, warmup=warmup)
+        results = runner.run(list(names))
+        db.session.remove()
+
+    with open(output, 'w') as f:
+        json.dump(dict(
+            commit=_commit(),
+            created=datetime.utcnow().isoformat(),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            parameters=dict(
+                users=users,
+                follows=follows,
+                shops=shops,
+                purchases=purchases,
+                csv_rows=csv_rows,
+                seed=seed,
+                repeat=repeat,
+                warmup=warmup
+            ),
+            data=counts,
+            results=results
+        ), f, indent=2)
+    click.echo("Results written to {0}".format(output))
+    if compare:
+        _compare(results, compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Reproducible synthetic flat data. The same seed and sizes always give the
+same users, follower graph, shops and purchases, so timings of different
+commits are taken on equal data.
+
+.. module:: benchmarks.data
+   :platform: Unix, Windows
+   :synopsis: Synthetic flat data generator.
+
+:Functions:
+
+    :func:`generate`
+    :func:`write_purchase_csv`
+"""
+
+import csv
+import random
+from datetime import datetime, timedelta
+from werkzeug.security import generate_password_hash
+from app import db
+from app.models import User, Shop, Purchase, MonthlySummary, followers, \
+    purchases_table
+
+
+password = 'benchmark'
+
+_words = [
+    'bread', 'milk', 'coffee', 'tea', 'cheese', 'apples', 'pasta', 'rice',
+    'soap', 'detergent', 'toilet paper', 'beer', 'wine', 'eggs', 'butter',
+    'tomatoes', 'onions', 'potatoes', 'chocolate', 'batteries', 'light bulb',
+    'Brot', 'Kaffee', 'Milch', 'Spülmittel', 'brood', 'kaas', 'koffie'
+]
+_first_date = datetime(2018, 1, 1)
+
+
+def _subject(rng):
+    return ' '.join(rng.sample(_words, rng.randint(1, 3)))
+
+
+def _purchase(rng, usernames, shopnames, days):
+    return dict(
+        user=rng.choice(usernames),
+        purchaser=rng.choice(usernames),
+        purchase_date=_first_date + timedelta(days=rng.randrange(days)),
+        shop=rng.choice(shopnames),
+        subject=_subject(rng),
+        value=round(rng.uniform(0.5, 120.), 2)
+    )
+
+
+def _insert(table, rows, chunksize=10000):
+    for start in range(0, len(rows), chunksize):
+        db.session.execute(table.insert(), rows[start:start + chunksize])
+
+
+def generate(users: int = 20, follows: int = 5, shops: int = 30,
+             purchases: int = 10000, days: int = 365, seed: int = 0):
+    """Fill the empty database of the current app with a synthetic flat.
+
+    :param users: Number of users, named user0000, user0001, ...
+    :type users: int
+    :param follows: Number of users every user follows.
+    :type follows: int
+    :param shops: Number of shops.
+    :type shops: int
+    :param purchases: Number of purchases.
+    :type purchases: int
+    :param days: Purchase dates are spread over days from 2018-01-01.
+    :type days: int
+    :param seed: Seed of the random generator.
+    :type seed: int
+    :returns: Number of rows per table.
+    :rtype: dict
+    """
+
+    rng = random.Random(seed)
+    db.create_all()
+
+    # one hash for all, hashing is slow and not what is benchmarked
+    password_hash = generate_password_hash(password)
+    usernames = ['user{0:04d}'.format(i) for i in range(users)]
+    _insert(User.__table__, [
+        dict(
+            id=i + 1,
+            username=username,
+            email='{0}@example.com'.format(username),
+            password_hash=password_hash,
+            last_seen=_first_date
+        ) for i, username in enumerate(usernames)
+    ])
+
+    links = []
+    for follower in range(1, users + 1):
+        others = [i for i in range(1, users + 1) if i != follower]
+        for followed in rng.sample(others, min(follows, len(others))):
+            links.append(dict(follower_id=follower, followed_id=followed))
+    _insert(followers, links)
+
+    shopnames = ['shop{0:04d}'.format(i) for i in range(shops)]
+    _insert(Shop.__table__, [
+        dict(id=i + 1, shopname=shopname)
+        for i, shopname in enumerate(shopnames)
+    ])
+
+    user_ids = {username: i + 1 for i, username in enumerate(usernames)}
+    shop_ids = {shopname: i + 1 for i, shopname in enumerate(shopnames)}
+    rows = []
+    for i in range(purchases):
+        purchase = _purchase(rng, usernames, shopnames, days)
+        rows.append(dict(
+            id=i + 1,
+            user_id=user_ids[purchase['user']],
+            purchaser_id=user_ids[purchase['purchaser']],
+            shop_id=shop_ids[purchase['shop']],
+            purchase_date=purchase['purchase_date'],
+            timestamp=purchase['purchase_date'] + timedelta(
+                seconds=rng.randrange(24 * 3600)
+            ),
+            subject=purchase['subject'],
+            value=purchase['value'],
+            language=None
+        ))
+    _insert(Purchase.__table__, [
+        {key: value for key, value in row.items() if key != 'purchaser_id'}
+        for row in rows
+    ])
+    _insert(purchases_table, [
+        dict(purchaser_id=row['purchaser_id'], purchase_id=row['id'])
+        for row in rows
+    ])
+    db.session.commit()
+    MonthlySummary.rebuild()
+    return dict(
+        users=users,
+        followers=len(links),
+        shops=shops,
+        purchases=purchases
+    )
+
+
+def write_purchase_csv(path: str, rows: int, seed: int = 1):
+    """Write new purchases of the users and shops of the current database as
+    ';' separated .csv file in the format of
+    :meth:`app.models.Purchase._load_from_csv`.
+
+    :param path: Path of the .csv file.
+    :type path: str
+    :param rows: Number of purchases.
+    :type rows: int
+    :param seed: Seed of the random generator, use another seed than for
+                 :func:`generate` to get new purchases.
+    :type seed: int
+    """
+
+    rng = random.Random(seed)
+    usernames = [u for u, in db.session.query(User.username).order_by(User.id)]
+    shopnames = [s for s, in db.session.query(Shop.shopname).order_by(Shop.id)]
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, delimiter=';', fieldnames=[
+            'user', 'purchaser', 'purchase_date', 'shop', 'subject', 'value'
+        ])
+        writer.writeheader()
+        for _ in range(rows):
+            purchase = _purchase(rng, usernames, shopnames, 365)
+            purchase['purchase_date'] = \
+                purchase['purchase_date'].strftime('%Y-%m-%d')
+            writer.writerow(purchase)
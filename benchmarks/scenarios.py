@@ -0,0 +1,287 @@
+"""Timed scenarios of the hot paths. A scenario is registered with
+:func:`scenario` and returns the callable to time and an optional setup
+callable, which runs untimed before every repetition and once after the
+last one.
+
+.. module:: benchmarks.scenarios
+   :platform: Unix, Windows
+   :synopsis: Timed benchmark scenarios.
+
+:Classes:
+
+    :class:`Runner`
+
+:Functions:
+
+    :func:`scenario`
+
+:Attributes:
+
+    :param scenarios: Registered scenarios by name.
+    :type scenarios: OrderedDict
+"""
+
+import statistics
+from collections import OrderedDict
+from time import perf_counter
+from flask import current_app
+from app import db, data_version
+from app.models import User, Purchase, MonthlySummary, purchases_table
+from benchmarks.data import password
+
+scenarios = OrderedDict()
+
+
+def scenario(name: str):
+    """Register a scenario function under name. The function gets the
+    :class:`Runner` and returns (setup, run)."""
+    def register(func):
+        scenarios[name] = func
+        return func
+    return register
+
+
+class Runner(object):
+    """Run scenarios against the database of the current app.
+
+    :param app: Benchmark app, see :func:`benchmarks.create_benchmark_app`.
+    :type app: flask.Flask
+    :param csv_path: Purchase .csv file for the import scenarios.
+    :type csv_path: str
+    :param repeat: Timed repetitions per scenario.
+    :type repeat: int
+    :param warmup: Untimed repetitions per scenario before timing.
+    :type warmup: int
+    """
+
+    def __init__(self, app, csv_path: str, repeat: int = 5, warmup: int = 1):
+        self.app = app
+        self.csv_path = csv_path
+        self.repeat = repeat
+        self.warmup = warmup
+        self.client = app.test_client()
+        self.username = db.session.query(User.username).order_by(
+            User.id
+        ).first()[0]
+        self.max_purchase_id = db.session.query(
+            db.func.max(Purchase.id)
+        ).scalar() or 0
+        self._login()
+
+    def _login(self):
+        response = self.client.post('/auth/login', data=dict(
+            username=self.username,
+            password=password
+        ))
+        if response.status_code != 302:
+            raise RuntimeError("benchmark login failed")
+
+    def get(self, url: str):
+        """GET url with the test client, fail on other status than 200."""
+        response = self.client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(
+                "GET {0}: {1}".format(url, response.status_code)
+            )
+        return response
+
+    def callback(self, output: str, inputs: list):
+        """Call a flat report callback like the Dash front end does.
+
+        :param output: Output as 'id.property'.
+        :type output: str
+        :param inputs: (id, property, value) of each callback input.
+        :type inputs: list
+        """
+        id, property = output.split('.')
+        response = self.client.post('/flat_report/_dash-update-component',
+                                    json=dict(
+            output=output,
+            outputs=dict(id=id, property=property),
+            inputs=[
+                dict(id=id, property=property, value=value)
+                for id, property, value in inputs
+            ],
+            changedPropIds=[
+                '{0}.{1}'.format(id, property) for id, property, value in inputs
+            ],
+            state=[]
+        ))
+        if response.status_code != 200:
+            raise RuntimeError(
+                "callback {0}: {1}".format(output, response.status_code)
+            )
+        return response
+
+    def reset_purchases(self):
+        """Drop purchases added by a scenario since the runner started."""
+        db.session.execute(purchases_table.delete().where(
+            purchases_table.c.purchase_id > self.max_purchase_id
+        ))
+        db.session.execute(Purchase.__table__.delete().where(
+            Purchase.id > self.max_purchase_id
+        ))
+        db.session.commit()
+        MonthlySummary.rebuild()
+
+    def run(self, names: list = None):
+        """Run the scenarios, all registered if names is None.
+
+        :returns: Timings in seconds per scenario name.
+        :rtype: OrderedDict
+        """
+        results = OrderedDict()
+        for name in names or scenarios:
+            setup, run = scenarios[name](self)
+            times = []
+            for i in range(self.warmup + self.repeat):
+                if setup is not None:
+                    setup()
+                start = perf_counter()
+                run()
+                if i >= self.warmup:
+                    times.append(perf_counter() - start)
+            if setup is not None:
+                # leave the state as found for the next scenario
+                setup()
+            results[name] = dict(
+                runs=len(times),
+                min=min(times),
+                median=statistics.median(times),
+                mean=statistics.mean(times),
+                max=max(times)
+            )
+            current_app.logger.info(
+                "{0}: median {1:.4f}s".format(name, results[name]['median'])
+            )
+        return results
+
+
+@scenario('index')
+def _index(runner):
+    return None, lambda: runner.get('/index')
+
+
+@scenario('explore')
+def _explore(runner):
+    return None, lambda: runner.get('/explore')
+
+
+@scenario('user')
+def _user(runner):
+    return None, lambda: runner.get('/user/' + runner.username)
+
+
+@scenario('members')
+def _members(runner):
+    return None, lambda: runner.get('/members')
+
+
+@scenario('followed_purchases')
+def _followed_purchases(runner):
+    def run():
+        user = User.query.filter_by(username=runner.username).first()
+        user.followed_purchases().paginate(
+            1, current_app.config['ELEMENTS_PER_PAGE'], False
+        ).items
+    return None, run
+
+
+@scenario('bought_purchases')
+def _bought_purchases(runner):
+    def run():
+        user = User.query.filter_by(username=runner.username).first()
+        user.bought_purchases().paginate(
+            1, current_app.config['ELEMENTS_PER_PAGE'], False
+        ).items
+    return None, run
+
+
+@scenario('is_following')
+def _is_following(runner):
+    def run():
+        user = User.query.filter_by(username=runner.username).first()
+        for other in User.query.order_by(User.id).limit(25):
+            user.is_following(other)
+    return None, run
+
+
+@scenario('bought')
+def _bought(runner):
+    def run():
+        user = User.query.filter_by(username=runner.username).first()
+        for purchase in Purchase.query.order_by(
+                Purchase.timestamp.desc()).limit(25):
+            user.bought(purchase)
+    return None, run
+
+
+@scenario('purchase_exists')
+def _purchase_exists(runner):
+    # the duplicate check of the row by row .csv import
+    def run():
+        for purchase in Purchase.query.order_by(Purchase.id).limit(25):
+            db.session.query(db.session.query(Purchase).filter(
+                Purchase.user_id == purchase.user_id,
+                Purchase.purchase_date == purchase.purchase_date,
+                Purchase.shop_id == purchase.shop_id,
+                Purchase.subject == purchase.subject,
+                Purchase.value == purchase.value
+            ).exists()).scalar()
+    return None, run
+
+
+@scenario('member_stats')
+def _member_stats(runner):
+    return None, lambda: User.get_member_stats(
+        User.query.order_by(User.id).limit(25).all()
+    )
+
+
+@scenario('add_purchases_from_csv')
+def _add_purchases_from_csv(runner):
+    return runner.reset_purchases, \
+        lambda: Purchase._add_purchases_from_csv(runner.csv_path)
+
+
+@scenario('bulk_add_purchases_from_csv')
+def _bulk_add_purchases_from_csv(runner):
+    return runner.reset_purchases, \
+        lambda: Purchase._bulk_add_purchases_from_csv(runner.csv_path)
+
+
+# report callbacks run cold, a new data version misses the memo and reloads
+# the purchase cache
+
+@scenario('report_graph')
+def _report_graph(runner):
+    return data_version.bump, lambda: runner.callback(
+        'my-graph.figure', [('my-dropdown', 'value', None)]
+    )
+
+
+@scenario('report_purchasers')
+def _report_purchasers(runner):
+    return data_version.bump, lambda: runner.callback(
+        'my-dropdown.options', [('url', 'pathname', '/flat_report/')]
+    )
+
+
+@scenario('report_table')
+def _report_table(runner):
+    return data_version.bump, lambda: runner.callback(
+        'purchases_table.data', [
+            ('purchases_table', 'pagination_settings',
+             {'current_page': 10, 'page_size': 5}),
+            ('purchases_table', 'filter', '{value} ge 50'),
+            ('purchases_table', 'sort_by',
+             [{'column_id': 'purchase_date', 'direction': 'desc'}])
+        ]
+    )
+
+
+@scenario('report_settlement')
+def _report_settlement(runner):
+    return data_version.bump, lambda: runner.callback(
+        'settlement.children', [('url', 'pathname', '/flat_report/')]
+    )
@@ -28,11 +28,105 @@ class Config(object):
     # MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     # MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
 
+    # Email delivery worker pool, queue and batch sizes, retries with
+    # backoff seconds and seconds to keep an idle SMTP connection open
+    EMAIL_WORKERS = int(os.environ.get('EMAIL_WORKERS') or 2)
+    EMAIL_QUEUE_SIZE = int(os.environ.get('EMAIL_QUEUE_SIZE') or 100)
+    EMAIL_BATCH_SIZE = int(os.environ.get('EMAIL_BATCH_SIZE') or 20)
+    EMAIL_MAX_RETRIES = int(os.environ.get('EMAIL_MAX_RETRIES') or 3)
+    EMAIL_RETRY_BACKOFF = float(os.environ.get('EMAIL_RETRY_BACKOFF') or 1)
+    EMAIL_IDLE_TIMEOUT = int(os.environ.get('EMAIL_IDLE_TIMEOUT') or 30)
+    # seconds to wait for room in a full queue before a message is dropped
+    EMAIL_ENQUEUE_TIMEOUT = float(
+        os.environ.get('EMAIL_ENQUEUE_TIMEOUT') or 5
+    )
+
     # Posts per page configuration
     ELEMENTS_PER_PAGE = int(os.environ.get('ELEMENTS_PER_PAGE'))
+    # Feed pagination mode, 'offset' (page numbers) or 'cursor' (keyset)
+    FEED_PAGINATION = os.environ.get('FEED_PAGINATION') or 'offset'
+    # Largest page of the JSON API
+    API_MAX_PER_PAGE = int(os.environ.get('API_MAX_PER_PAGE') or 100)
+
+    # Write-behind of users last seen time stamps, seconds between two
+    # flushes and minimum age of a stored time stamp before an update
+    LAST_SEEN_FLUSH_INTERVAL = int(
+        os.environ.get('LAST_SEEN_FLUSH_INTERVAL') or 60
+    )
+    LAST_SEEN_MIN_DELTA = int(os.environ.get('LAST_SEEN_MIN_DELTA') or 60)
+
+    # Identity cache of logged in users, seconds a user is served from cache
+    # and maximum number of cached users
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL') or 30)
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE') or 1024)
+
+    # Identicon avatars, directory of the rendered images, sizes used by the
+    # templates and maximum number of cached images
+    AVATAR_CACHE_PATH = (os.environ.get('AVATAR_CACHE_PATH') or
+                         os.path.join(basedir, 'avatars'))
+    AVATAR_SIZES = [
+        int(size) for size in
+        (os.environ.get('AVATAR_SIZES') or '70,128,256').split(',')
+    ]
+    AVATAR_CACHE_LIMIT = int(os.environ.get('AVATAR_CACHE_LIMIT') or 10000)
+
+    # Columnar purchase snapshot written by 'flask purchases snapshot' and
+    # read by the flat report on start up
+    PURCHASE_SNAPSHOT_PATH = (os.environ.get('PURCHASE_SNAPSHOT_PATH') or
+                              os.path.join(basedir, 'snapshot'))
+
+    # Rendered purchase and member cards, maximum number of cached fragments
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE') or 4096)
 
     # Internalization configuration
     LANGUAGES = os.environ.get('LANGUAGES').split(',')
 
     # Google Translator API configuration
     GOOGLE_TRANSLATOR_KEY = os.environ.get('GOOGLE_TRANSLATOR_KEY') or ''
+
+    # Translation backend ('google' or 'fake') and cache configuration
+    TRANSLATION_BACKEND = os.environ.get('TRANSLATION_BACKEND') or 'google'
+    TRANSLATION_CACHE_SIZE = int(
+        os.environ.get('TRANSLATION_CACHE_SIZE') or 1024
+    )
+    TRANSLATION_CACHE_TTL = int(
+        os.environ.get('TRANSLATION_CACHE_TTL') or 30 * 24 * 3600
+    )
+    TRANSLATION_STORE_PATH = (os.environ.get('TRANSLATION_STORE_PATH') or
+                              os.path.join(basedir, 'translations.db'))
+    TRANSLATION_STORE_SIZE = int(
+        os.environ.get('TRANSLATION_STORE_SIZE') or 100000
+    )
+    TRANSLATION_CONCURRENCY = int(
+        os.environ.get('TRANSLATION_CONCURRENCY') or 4
+    )
+    # Maximum number of purchases translated by one batch request
+    TRANSLATION_BATCH_MAX = int(
+        os.environ.get('TRANSLATION_BATCH_MAX') or 100
+    )
+
+    # Background language detection of purchase subjects, seconds between
+    # two runs and purchases per batch
+    LANGUAGE_DETECTION_INTERVAL = int(
+        os.environ.get('LANGUAGE_DETECTION_INTERVAL') or 300
+    )
+    LANGUAGE_DETECTION_BATCH = int(
+        os.environ.get('LANGUAGE_DETECTION_BATCH') or 500
+    )
+
+    # Version file of the purchase data, replaced on every purchase write
+    DATA_VERSION_PATH = (os.environ.get('DATA_VERSION_PATH') or
+                         os.path.join(basedir, 'data_version'))
+
+    # Flat report callback memoization, maximum results and SQLite file
+    # shared by all workers (empty to memoize per process)
+    REPORT_MEMO_SIZE = int(os.environ.get('REPORT_MEMO_SIZE') or 256)
+    REPORT_MEMO_PATH = os.environ.get('REPORT_MEMO_PATH') or ''
+    # Flat report dispatch, 'lazy' (mounted below /flat_report and built on
+    # first request) or 'external' (served by its own workers)
+    REPORT_DISPATCH = os.environ.get('REPORT_DISPATCH') or 'lazy'
+
+    # Request metrics, seconds after which a query is logged as slow query
+    SLOW_QUERY_THRESHOLD = float(
+        os.environ.get('SLOW_QUERY_THRESHOLD') or 0.5
+    )
@@ -0,0 +1,56 @@
+"""add indexes on join and filter columns
+
+Revision ID: 67fd8c9091c1
+Revises: f369549721fb
+Create Date: 2026-10-16 09:12:41.218407
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '67fd8c9091c1'
+down_revision = 'f369549721fb'
+branch_labels = None
+depends_on = None
+
+
+def _deduplicate(table_name, *column_names):
+    """Remove duplicate rows of an association table, so a unique index can
+    be created on it."""
+    conn = op.get_bind()
+    table = sa.table(table_name, *[sa.column(c) for c in column_names])
+    rows = conn.execute(
+        sa.select([table.c[c] for c in column_names]).distinct()
+    ).fetchall()
+    conn.execute(table.delete())
+    if rows:
+        conn.execute(
+            table.insert(),
+            [dict(zip(column_names, row)) for row in rows]
+        )
+
+
+def upgrade():
+    _deduplicate('followers', 'follower_id', 'followed_id')
+    op.create_index('ix_followers_follower_followed', 'followers', ['follower_id', 'followed_id'], unique=True)
+    op.create_index('ix_followers_followed_id', 'followers', ['followed_id'], unique=False)
+    _deduplicate('purchases_table', 'purchaser_id', 'purchase_id')
+    op.create_index('ix_purchases_table_purchaser_purchase', 'purchases_table', ['purchaser_id', 'purchase_id'], unique=True)
+    op.create_index('ix_purchases_table_purchase_id', 'purchases_table', ['purchase_id'], unique=False)
+    op.create_index('ix_purchase_user_id_timestamp', 'purchase', ['user_id', 'timestamp'], unique=False)
+    op.create_index('ix_purchase_user_id_purchase_date', 'purchase', ['user_id', 'purchase_date', 'shop_id'], unique=False)
+    op.create_index(op.f('ix_purchase_shop_id'), 'purchase', ['shop_id'], unique=False)
+    op.create_index(op.f('ix_purchase_purchase_date'), 'purchase', ['purchase_date'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_purchase_purchase_date'), table_name='purchase')
+    op.drop_index(op.f('ix_purchase_shop_id'), table_name='purchase')
+    op.drop_index('ix_purchase_user_id_purchase_date', table_name='purchase')
+    op.drop_index('ix_purchase_user_id_timestamp', table_name='purchase')
+    op.drop_index('ix_purchases_table_purchase_id', table_name='purchases_table')
+    op.drop_index('ix_purchases_table_purchaser_purchase', table_name='purchases_table')
+    op.drop_index('ix_followers_followed_id', table_name='followers')
+    op.drop_index('ix_followers_follower_followed', table_name='followers')